@@ -1,14 +1,24 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 from bson import ObjectId
 import bcrypt
 import jwt
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
+import json
+import base64
 from dotenv import load_dotenv
-from predictor import extract_text_and_predict
-import io
+from predictor import batching_stats, formulary, pipeline_version
+from worker_pool import inference_pool, run_predict, run_predict_batch, run_prediction_stages
+from cpu_topology import applied as cpu_topology_applied, replica_count
+from jobs import JobRunner, MAX_IMAGE_BYTES
+from metrics import CACHE_LOOKUPS, observe_timings, track_request, render_metrics
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from result_cache import ResultCache, DiskStore, MongoStore, make_key
+import time
+import threading
+from model_loader import corrector_handle
 
 # Load environment variables
 load_dotenv()
@@ -16,17 +26,61 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
+# The BERT corrector loads in the background so auth, history and admin
+# routes are served immediately. MODEL_PRELOAD=lazy defers it to the first
+# prediction instead. With INFERENCE_WORKERS > 0 the model lives in the
+# worker processes; the web process only loads it with
+# INFERENCE_START_METHOD=fork, to share its weights with the workers; the
+# workers are then forked here, before the MongoDB client starts its
+# threads, whatever MODEL_PRELOAD says.
+APP_STARTED_AT = time.time()
+MODEL_PRELOAD = os.getenv('MODEL_PRELOAD', 'background')  # background or lazy
+if MODEL_PRELOAD == 'background' or (inference_pool is not None and inference_pool.start_method == 'fork'):
+    if inference_pool is not None:
+        inference_pool.start_background()
+    else:
+        corrector_handle.start_background()
+
 # MongoDB connection
 client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
 db = client['prescription_system']
 users_collection = db['users']
 history_collection = db['prediction_history']
+jobs_collection = db['prediction_jobs']
+
+# Cache of prediction results for re-uploaded images
+RESULT_CACHE_TTL = int(os.getenv('RESULT_CACHE_TTL', '86400'))  # seconds
+RESULT_CACHE_STORE = os.getenv('RESULT_CACHE_STORE', 'memory')  # memory, disk or mongo
+if RESULT_CACHE_STORE == 'disk':
+    result_cache_store = DiskStore(
+        os.getenv('RESULT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'result_cache')),
+        RESULT_CACHE_TTL,
+        max_bytes=int(os.getenv('RESULT_CACHE_DISK_MAX_MB', '512')) * 1024 * 1024  # 0 = no size limit
+    )
+elif RESULT_CACHE_STORE == 'mongo':
+    result_cache_store = MongoStore(db['prediction_cache'], RESULT_CACHE_TTL)
+else:
+    result_cache_store = None
+result_cache = ResultCache(
+    max_entries=int(os.getenv('RESULT_CACHE_SIZE', '1024')),
+    ttl_seconds=RESULT_CACHE_TTL,
+    store=result_cache_store
+)
 
 # JWT configuration
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION = 24  # hours
 
+# Max number of images accepted by /api/predict/batch
+MAX_BATCH_IMAGES = int(os.getenv('MAX_BATCH_IMAGES', '32'))
+
+# Page size of /api/history: default and maximum
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '50'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '200'))
+# Fields /api/history can return; _id and created_at always are
+HISTORY_FIELDS = ('ocr_text', 'found_drugs', 'ocr_confidence', 'drug_confidence')
+
 def generate_token(user_id):
     """Generate JWT token for authenticated user"""
     payload = {
@@ -35,6 +89,152 @@ def generate_token(user_id):
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
+def predict_with_cache(image_data):
+    """Return (result, cached, timings) for raw image bytes, running the pipeline only on a cache miss"""
+    timings = {}
+    started = time.perf_counter()
+    cache_key = make_key(image_data, pipeline_version())
+    result = result_cache.get(cache_key)
+    timings['cache_lookup'] = time.perf_counter() - started
+    if result is not None:
+        CACHE_LOOKUPS.labels(result='hit').inc()
+        return result, True, timings
+
+    CACHE_LOOKUPS.labels(result='miss').inc()
+    result = run_predict(image_data)
+    timings.update(result.pop('timings', {}))
+    cache_result(image_data, result)
+    return result, False, timings
+
+def cache_result(image_data, result):
+    """Cache a prediction unless it failed, so a temporary error is not served to re-uploads.
+
+    The key uses the pipeline version the result reports, since the worker
+    that computed it may have had a newer or older formulary than this process.
+    """
+    version = result.pop('pipeline_version', None)
+    if version and 'error' not in result and not result.get('correction_failed'):
+        result_cache.put(make_key(image_data, version), result)
+
+def save_history(user_id, result, timings):
+    started = time.perf_counter()
+    history_collection.insert_one(make_history_entry(user_id, result))
+    timings['history_insert'] = time.perf_counter() - started
+
+def wants_timings():
+    return request.args.get('timings', '').lower() in ('1', 'true', 'yes')
+
+def make_history_entry(user_id, result):
+    return {
+        'user_id': ObjectId(user_id),
+        'ocr_text': result['ocr_text'],
+        'found_drugs': result['found_drugs'],
+        'ocr_confidence': result['ocr_confidence'],
+        'drug_confidence': result['drug_confidence'],
+        'created_at': datetime.utcnow()
+    }
+
+def encode_history_cursor(entry):
+    """Opaque cursor pointing just past entry in (created_at, _id) order"""
+    key = f"{entry['created_at'].isoformat()}|{entry['_id']}"
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+def decode_history_cursor(cursor):
+    try:
+        created_at, entry_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), ObjectId(entry_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def parse_history_date(value, name):
+    """ISO date or datetime as the naive UTC datetime history entries are stored with"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid {name} date: {value}')
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def process_prediction_job(job):
+    result, _, timings = predict_with_cache(bytes(job['image']))
+    save_history(job['user_id'], result, timings)
+    observe_timings(timings)
+    return result
+
+# Background runner for /api/predict/jobs
+job_runner = JobRunner(
+    jobs_collection,
+    process_prediction_job,
+    workers=int(os.getenv('JOB_WORKERS', '1')),
+    lease_seconds=int(os.getenv('JOB_LEASE_SECONDS', '300')),
+    result_ttl_seconds=int(os.getenv('JOB_RESULT_TTL', str(7 * 86400))),
+    max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+)
+JOBS_ENABLED = os.getenv('JOBS_ENABLED', '1') == '1'
+
+# Indexes are created and the job runner started by a background thread
+# that retries until MongoDB is reachable, so an outage neither blocks the
+# import for the server selection timeout nor fails it; /readyz reports
+# the state.
+MONGO_STARTUP_RETRY_SECONDS = float(os.getenv('MONGO_STARTUP_RETRY_SECONDS', '30'))
+mongo_startup = {'state': 'pending', 'error': None}
+
+def ensure_indexes():
+    # /api/history pages through a user's entries newest first along this index
+    history_collection.create_index([('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)])
+    if isinstance(result_cache_store, MongoStore):
+        result_cache_store.ensure_indexes()
+    if JOBS_ENABLED:
+        job_runner.ensure_indexes()
+
+def run_mongo_startup():
+    while True:
+        try:
+            ensure_indexes()
+            mongo_startup.update({'state': 'ready', 'error': None})
+        except Exception as e:
+            mongo_startup.update({'state': 'retrying', 'error': str(e)})
+        # The runner retries its own queries, it need not wait for the indexes
+        if JOBS_ENABLED:
+            job_runner.start()
+        if mongo_startup['state'] == 'ready':
+            return
+        time.sleep(MONGO_STARTUP_RETRY_SECONDS)
+
+threading.Thread(target=run_mongo_startup, name='mongo-startup', daemon=True).start()
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({
+        'status': 'ok',
+        'uptime_seconds': round(time.time() - APP_STARTED_AT, 3)
+    }), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    if inference_pool is not None:
+        model_status = inference_pool.status()
+    else:
+        model_status = corrector_handle.status()
+    ready = model_status['ready']
+    if MODEL_PRELOAD == 'lazy' and not ready:
+        # The model loads on the first prediction, which a readiness-gated
+        # load balancer only sends to a ready instance
+        ready = True
+        if model_status['state'] in ('not_loaded', 'not_started'):
+            model_status = dict(model_status, state='lazy')
+    return jsonify({
+        'status': 'ready' if ready else model_status['state'],
+        'model': model_status,
+        'database': mongo_startup
+    }), 200 if ready else 503
+
 @app.route('/api/auth/register', methods=['POST'])
 def register():
     try:
@@ -377,33 +577,263 @@ def predict():
             return jsonify({'error': 'Empty image file'}), 400
 
         # Convert the file to bytes
-        image_bytes = io.BytesIO(image_file.read())
-        
-        # Get predictions
-        ocr_text, predicted_text, found_drugs, ocr_confidence, drug_confidence = extract_text_and_predict(image_bytes)
-
-        # Store in history
-        history_entry = {
-            'user_id': ObjectId(user_id),
-            'ocr_text': ocr_text,
-            'found_drugs': found_drugs,
-            'ocr_confidence': ocr_confidence,
-            'drug_confidence': drug_confidence,
-            'created_at': datetime.utcnow()
+        image_data = image_file.read()
+
+        with track_request('predict') as tracked:
+            # Get predictions, reusing the result of an identical earlier upload
+            try:
+                result, cached, timings = predict_with_cache(image_data)
+            except FutureTimeoutError:
+                tracked['outcome'] = 'timeout'
+                return jsonify({'error': 'Prediction timed out'}), 504
+
+            # Store in history
+            save_history(user_id, result, timings)
+            observe_timings(timings)
+
+        response = {
+            'ocr_text': result['ocr_text'],
+            'predicted_text': result['predicted_text'],
+            'found_drugs': result['found_drugs'],
+            'ocr_confidence': result['ocr_confidence'],
+            'drug_confidence': result['drug_confidence'],
+            'ocr_words': result['ocr_words'],
+            'cached': cached
         }
-        history_collection.insert_one(history_entry)
+        if wants_timings():
+            response['timings'] = timings
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_batch():
+    try:
+        image_files = request.files.getlist('images')
+        if not image_files:
+            return jsonify({'error': 'No image files provided'}), 400
+
+        if len(image_files) > MAX_BATCH_IMAGES:
+            return jsonify({'error': f'At most {MAX_BATCH_IMAGES} images can be uploaded per batch'}), 400
+
+        # Get user ID from token
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'No authorization token provided'}), 401
+
+        token = auth_header.split(' ')[1]
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            user_id = payload['user_id']
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+        # Convert the files to bytes
+        image_data = [image_file.read() for image_file in image_files]
+
+        with track_request('predict_batch') as tracked:
+            # Serve cached results, predict the rest with one batched BERT pass
+            version = pipeline_version()
+            cache_keys = [make_key(data, version) for data in image_data]
+            predictions = [result_cache.get(key) for key in cache_keys]
+            cached = [prediction is not None for prediction in predictions]
+            timings = [{} for _ in predictions]
+            missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+            CACHE_LOOKUPS.labels(result='hit').inc(len(predictions) - len(missing))
+            CACHE_LOOKUPS.labels(result='miss').inc(len(missing))
+            if missing:
+                try:
+                    fresh = run_predict_batch([image_data[i] for i in missing])
+                except FutureTimeoutError:
+                    tracked['outcome'] = 'timeout'
+                    return jsonify({'error': 'Prediction timed out'}), 504
+                for i, prediction in zip(missing, fresh):
+                    timings[i] = prediction.pop('timings', {})
+                    observe_timings(timings[i])
+                    predictions[i] = prediction
+                    cache_result(image_data[i], prediction)
+
+            # Store successful predictions in history
+            history_entries = []
+            results = []
+            for index, (image_file, prediction) in enumerate(zip(image_files, predictions)):
+                result = {'index': index, 'filename': image_file.filename, 'cached': cached[index]}
+                result.update(prediction)
+                if wants_timings():
+                    result['timings'] = timings[index]
+                results.append(result)
+
+                if 'error' in prediction:
+                    continue
+                history_entries.append(make_history_entry(user_id, prediction))
+            if history_entries:
+                history_collection.insert_many(history_entries)
 
         return jsonify({
-            'ocr_text': ocr_text,
-            'predicted_text': predicted_text,
-            'found_drugs': found_drugs,
-            'ocr_confidence': ocr_confidence,
-            'drug_confidence': drug_confidence
+            'results': results
         }), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/predict/stream', methods=['POST'])
+def predict_stream():
+    try:
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image file provided'}), 400
+
+        # Get user ID from token
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'No authorization token provided'}), 401
+
+        token = auth_header.split(' ')[1]
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            user_id = payload['user_id']
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+        image_file = request.files['image']
+        if not image_file:
+            return jsonify({'error': 'Empty image file'}), 400
+
+        image_data = image_file.read()
+        include_timings = wants_timings()
+
+        def generate():
+            with track_request('predict_stream') as tracked:
+                try:
+                    cache_key = make_key(image_data, pipeline_version())
+                    result = result_cache.get(cache_key)
+                    timings = {}
+                    if result is None:
+                        CACHE_LOOKUPS.labels(result='miss').inc()
+                        # Each stage is streamed as it finishes; with the worker pool
+                        # matches arrive before correction starts
+                        for stage, data in run_prediction_stages(image_data):
+                            if stage == 'result':
+                                result = data
+                            else:
+                                yield sse_event(stage, data)
+                        timings = result.pop('timings', {})
+                        cache_result(image_data, result)
+                        result['cached'] = False
+                    else:
+                        CACHE_LOOKUPS.labels(result='hit').inc()
+                        result['cached'] = True
+
+                    save_history(user_id, result, timings)
+                    observe_timings(timings)
+                    if include_timings:
+                        result['timings'] = timings
+                    yield sse_event('result', result)
+                except FutureTimeoutError:
+                    tracked['outcome'] = 'timeout'
+                    yield sse_event('error', {'error': 'Prediction timed out'})
+                except Exception as e:
+                    tracked['outcome'] = 'error'
+                    yield sse_event('error', {'error': str(e)})
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/predict/jobs', methods=['POST'])
+def create_prediction_job():
+    try:
+        if not JOBS_ENABLED:
+            return jsonify({'error': 'Prediction jobs are disabled'}), 503
+
+        if 'image' not in request.files:
+            return jsonify({'error': 'No image file provided'}), 400
+
+        # Get user ID from token
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'No authorization token provided'}), 401
+
+        token = auth_header.split(' ')[1]
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            user_id = payload['user_id']
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+        image_file = request.files['image']
+        if not image_file:
+            return jsonify({'error': 'Empty image file'}), 400
+
+        image_data = image_file.read()
+        if len(image_data) > MAX_IMAGE_BYTES:
+            return jsonify({'error': f'Image is larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB'}), 413
+
+        # Queue the prediction, a background runner processes it
+        job_id = job_runner.submit(ObjectId(user_id), image_data, filename=image_file.filename)
+
+        return jsonify({
+            'job_id': str(job_id),
+            'status': 'queued',
+            'status_url': f'/api/predict/jobs/{job_id}'
+        }), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/predict/jobs/<job_id>', methods=['GET'])
+def get_prediction_job(job_id):
+    try:
+        # Get user ID from token
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'No authorization token provided'}), 401
+
+        token = auth_header.split(' ')[1]
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            user_id = payload['user_id']
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+        if not ObjectId.is_valid(job_id):
+            return jsonify({'error': 'Job not found'}), 404
+
+        job = jobs_collection.find_one(
+            {'_id': ObjectId(job_id), 'user_id': ObjectId(user_id)},
+            {'image': 0}
+        )
+        if not job:
+            return jsonify({'error': 'Job not found'}), 404
+
+        response = {
+            'job_id': str(job['_id']),
+            'status': job['status'],
+            'filename': job.get('filename'),
+            'created_at': job['created_at'].isoformat()
+        }
+        for field in ['started_at', 'finished_at']:
+            if job.get(field):
+                response[field] = job[field].isoformat()
+        if 'result' in job:
+            response['result'] = job['result']
+        if 'error' in job:
+            response['error'] = job['error']
+
+        return jsonify(response), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/history', methods=['GET'])
 def get_history():
     try:
@@ -419,11 +849,62 @@ def get_history():
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token'}), 401
 
-        # Get history entries for the user
+        # Query parameters: limit, cursor (next_cursor of the previous page),
+        # fields (comma separated), summary (no ocr_text), from/to dates and drug
+        try:
+            limit = int(request.args.get('limit', HISTORY_PAGE_SIZE))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+        fields = list(HISTORY_FIELDS)
+        if request.args.get('fields'):
+            fields = [field.strip() for field in request.args['fields'].split(',') if field.strip()]
+            unknown = [field for field in fields if field not in HISTORY_FIELDS]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        if request.args.get('summary', '').lower() in ('1', 'true', 'yes'):
+            fields = [field for field in fields if field != 'ocr_text']
+        projection = {field: 1 for field in fields}
+        projection['user_id'] = 1
+        projection['created_at'] = 1
+
+        conditions = [{'user_id': ObjectId(user_id)}]
+        try:
+            created_at = {}
+            if request.args.get('from'):
+                created_at['$gte'] = parse_history_date(request.args['from'], 'from')
+            if request.args.get('to'):
+                # Inclusive; a date without a time covers the whole day
+                to = parse_history_date(request.args['to'], 'to')
+                if len(request.args['to']) == len('YYYY-MM-DD'):
+                    created_at['$lt'] = to + timedelta(days=1)
+                else:
+                    created_at['$lte'] = to
+            if created_at:
+                conditions.append({'created_at': created_at})
+            if request.args.get('cursor'):
+                cursor_created_at, cursor_id = decode_history_cursor(request.args['cursor'])
+                conditions.append({'$or': [
+                    {'created_at': {'$lt': cursor_created_at}},
+                    {'created_at': cursor_created_at, '_id': {'$lt': cursor_id}}
+                ]})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        drugs = [drug.strip().lower() for drug in request.args.getlist('drug') if drug.strip()]
+        if drugs:
+            conditions.append({'found_drugs': {'$all': drugs}})
+
+        # One extra entry tells whether there is a next page
         history = list(history_collection.find(
-            {'user_id': ObjectId(user_id)},
-            sort=[('created_at', -1)]  # Sort by most recent first
+            {'$and': conditions},
+            projection,
+            sort=[('created_at', -1), ('_id', -1)],  # Most recent first
+            limit=limit + 1
         ))
+        has_more = len(history) > limit
+        history = history[:limit]
+        next_cursor = encode_history_cursor(history[-1]) if has_more else None
 
         # Convert ObjectId and datetime to strings for JSON serialization
         for entry in history:
@@ -432,7 +913,9 @@ def get_history():
             entry['created_at'] = entry['created_at'].isoformat()
 
         return jsonify({
-            'history': history
+            'history': history,
+            'next_cursor': next_cursor,
+            'has_more': has_more
         }), 200
 
     except Exception as e:
@@ -501,6 +984,104 @@ def get_all_logs():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/inference/stats', methods=['GET'])
+def get_inference_stats():
+    try:
+        # Get user ID from token
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'No authorization token provided'}), 401
+
+        token = auth_header.split(' ')[1]
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            user_id = payload['user_id']
+            
+            # Check if user is admin
+            user = users_collection.find_one({'_id': ObjectId(user_id)})
+            if not user or user.get('role') != 'admin':
+                return jsonify({'error': 'Unauthorized access'}), 403
+                
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+        return jsonify({
+            'worker_pool': inference_pool.status() if inference_pool is not None else None,
+            'worker_memory': inference_pool.memory() if inference_pool is not None else None,
+            # Threads of the inline corrector; pool workers report theirs above
+            'cpu_topology': {'replicas': replica_count(), **cpu_topology_applied},
+            'batching': batching_stats(),
+            'jobs': {'queued': job_runner.queue_depth()},
+            'result_cache': result_cache.stats()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/formulary', methods=['GET'])
+def get_formulary_status():
+    try:
+        # Get user ID from token
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'No authorization token provided'}), 401
+
+        token = auth_header.split(' ')[1]
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            user_id = payload['user_id']
+            
+            # Check if user is admin
+            user = users_collection.find_one({'_id': ObjectId(user_id)})
+            if not user or user.get('role') != 'admin':
+                return jsonify({'error': 'Unauthorized access'}), 403
+                
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+        return jsonify({
+            'formulary': formulary.status()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/formulary/reload', methods=['POST'])
+def reload_formulary():
+    try:
+        # Get user ID from token
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({'error': 'No authorization token provided'}), 401
+
+        token = auth_header.split(' ')[1]
+        try:
+            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            user_id = payload['user_id']
+            
+            # Check if user is admin
+            user = users_collection.find_one({'_id': ObjectId(user_id)})
+            if not user or user.get('role') != 'admin':
+                return jsonify({'error': 'Unauthorized access'}), 403
+                
+        except jwt.InvalidTokenError:
+            return jsonify({'error': 'Invalid token'}), 401
+
+        # Build the new dictionary and swap it in, predictions keep using the old one until then.
+        # Other processes follow once they see the file's new mtime (FORMULARY_CHECK_INTERVAL).
+        try:
+            formulary.reload()
+        except Exception as e:
+            return jsonify({'error': f'Formulary reload failed: {str(e)}'}), 500
+
+        return jsonify({
+            'message': 'Formulary reloaded successfully',
+            'formulary': formulary.status()
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/admin/dashboard/stats', methods=['GET'])
 def get_admin_dashboard_stats():
     try:
@@ -0,0 +1,123 @@
+# batching.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Collects items submitted from many threads and processes them in batches.
+
+    A background thread waits for the first queued item, then keeps collecting
+    until max_batch_size items are queued or max_wait_ms has passed since that
+    first item, and calls process_batch(items) once. process_batch must return
+    one result per item, in order. Each caller blocks until its own result is
+    ready.
+    """
+
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=10.0, name="micro-batcher", observer=None):
+        self.process_batch = process_batch
+        # Optional callback(batch_size, waits, process_seconds, queue_depth) after each batch
+        self.observer = observer
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._last_batch_size = 0
+        self._max_batch_seen = 0
+        self._batch_size_counts = {}
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+        self._total_process_time = 0.0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item, timeout=None):
+        """Queue item and block until its result is available"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future.result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"process_batch returned {len(results)} results for {len(items)} items")
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+                failed = False
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                failed = True
+            self._record(batch, started, time.perf_counter() - started, failed)
+
+    def _record(self, batch, started, process_time, failed):
+        waits = [started - enqueued for _, _, enqueued in batch]
+        size = len(batch)
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            if failed:
+                self._errors += 1
+            self._last_batch_size = size
+            self._max_batch_seen = max(self._max_batch_seen, size)
+            self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+            self._total_wait += sum(waits)
+            self._max_wait_seen = max(self._max_wait_seen, max(waits))
+            self._total_process_time += process_time
+        if self.observer is not None:
+            try:
+                self.observer(size, waits, process_time, self._queue.qsize())
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batches': self._batches,
+                'items': self._items,
+                'errors': self._errors,
+                'last_batch_size': self._last_batch_size,
+                'max_batch_size_seen': self._max_batch_seen,
+                'avg_batch_size': (self._items / self._batches) if self._batches else 0.0,
+                'batch_size_counts': {str(size): count for size, count in sorted(self._batch_size_counts.items())},
+                'avg_wait_ms': (self._total_wait / self._items * 1000.0) if self._items else 0.0,
+                'max_wait_ms_seen': self._max_wait_seen * 1000.0,
+                'avg_batch_time_ms': (self._total_process_time / self._batches * 1000.0) if self._batches else 0.0
+            }
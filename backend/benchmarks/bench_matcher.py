@@ -0,0 +1,105 @@
+# benchmarks/bench_matcher.py
+"""Scaling of fuzzy drug-name lookup with formulary size.
+
+Builds DrugMatcher over synthetic formularies of each size (see
+synthetic.generate_drug_names) and looks up OCR-misspelled names and
+unrelated words, uncached. Reports per-lookup latency, the number of names
+SequenceMatcher scores, and the same lookups with difflib.get_close_matches
+for comparison (--difflib-max-size caps the sizes difflib runs at, it scans
+every name). Run from the backend directory:
+
+    python -m benchmarks.bench_matcher --sizes 1000 10000 100000 --output matcher.json
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from difflib import get_close_matches
+
+from benchmarks.bench_pipeline import git_commit, summarize
+from benchmarks.synthetic import generate_drug_names, ocr_noise
+
+
+def make_queries(names, count, seed=0):
+    """Mostly OCR-misspelled names, plus words that match nothing"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            queries.append(ocr_noise(rng.choice(names), rng, edits=rng.choice([1, 1, 2])).lower())
+        else:
+            queries.append(rng.choice(["tablet", "daily", "patient", "signature", "morning", "refill"]))
+    return queries
+
+
+def bench_size(size, queries_per_size, cutoff, with_difflib, seed):
+    from drug_matcher import DrugMatcher
+
+    names = generate_drug_names(size, seed=seed)
+    started = time.perf_counter()
+    matcher = DrugMatcher(names, cutoff=cutoff)
+    build_time = time.perf_counter() - started
+    queries = make_queries(matcher.names, queries_per_size, seed=seed)
+
+    latencies = []
+    candidates = []
+    for query in queries:
+        started = time.perf_counter()
+        matcher._best_match(query)
+        latencies.append(time.perf_counter() - started)
+        candidates.append(matcher.candidate_count(query))
+
+    entry = {
+        'names': len(matcher.names),
+        'build_seconds': round(build_time, 3),
+        'matcher': summarize(latencies),
+        'mean_candidates': round(sum(candidates) / len(candidates), 1),
+        'candidate_fraction': round(sum(candidates) / len(candidates) / len(matcher.names), 5)
+    }
+    if with_difflib:
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            get_close_matches(query, matcher.names, n=1, cutoff=cutoff)
+            latencies.append(time.perf_counter() - started)
+        entry['difflib'] = summarize(latencies)
+    return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000], help="formulary sizes")
+    parser.add_argument("--queries", type=int, default=200, help="lookups per size")
+    parser.add_argument("--cutoff", type=float, default=0.75)
+    parser.add_argument("--difflib-max-size", type=int, default=100000, help="largest size difflib is timed at")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write the JSON report to this path")
+    args = parser.parse_args(argv)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform()},
+        'config': {'queries': args.queries, 'cutoff': args.cutoff, 'seed': args.seed},
+        'results': {}
+    }
+
+    print(f"{'names':>8}{'build s':>9}{'p50 ms':>9}{'p95 ms':>9}{'candidates':>12}{'difflib p50 ms':>16}")
+    for size in args.sizes:
+        entry = bench_size(size, args.queries, args.cutoff, size <= args.difflib_max_size, args.seed)
+        report['results'][str(size)] = entry
+        difflib = f"{entry['difflib']['p50_ms']:>16.2f}" if 'difflib' in entry else f"{'-':>16}"
+        print(f"{entry['names']:>8}{entry['build_seconds']:>9.2f}{entry['matcher']['p50_ms']:>9.2f}"
+              f"{entry['matcher']['p95_ms']:>9.2f}{entry['mean_candidates']:>12.0f}{difflib}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
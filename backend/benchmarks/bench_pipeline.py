@@ -0,0 +1,198 @@
+# benchmarks/bench_pipeline.py
+"""Benchmark preprocessing and the full OCR + correction pipeline.
+
+Runs fully offline on CPU with synthetic images (see synthetic.py) and
+writes a JSON report that benchmarks/compare.py can diff between commits.
+Each image size runs in a fresh process, so its peak_rss_mb is its own.
+Run from the backend directory:
+
+    python -m benchmarks.bench_pipeline --output bench.json
+    python -m benchmarks.bench_pipeline --sizes 800x600 2480x3508 --batch-sizes 1 8 --images 16
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Measure the pipeline itself, not the micro-batching window or a worker pool
+os.environ.setdefault("BERT_BATCH_WINDOW_MS", "0")
+os.environ.setdefault("MODEL_PRELOAD", "lazy")
+
+from benchmarks.synthetic import generate_image_set, load_drug_names
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies, items_per_call=1):
+    total = sum(latencies)
+    return {
+        'calls': len(latencies),
+        'p50_ms': round(percentile(latencies, 50) * 1000.0, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000.0, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000.0, 3),
+        'mean_ms': round(total / len(latencies) * 1000.0, 3) if latencies else 0.0,
+        'throughput_per_s': round(len(latencies) * items_per_call / total, 3) if total else 0.0
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def bench_preprocess(images, repeat):
+    from preprocessing import load_image, binarize
+
+    latencies = []
+    for _ in range(repeat):
+        for item in images:
+            started = time.perf_counter()
+            binarize(load_image(io.BytesIO(item['image'])))
+            latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+def bench_single(images, repeat):
+    from predictor import predict_image
+
+    latencies = []
+    stage_totals = {}
+    hits = 0
+    expected = 0
+    for _ in range(repeat):
+        for item in images:
+            started = time.perf_counter()
+            result = predict_image(io.BytesIO(item['image']))
+            latencies.append(time.perf_counter() - started)
+            for stage, seconds in result.get('timings', {}).items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+            hits += len(set(item['drugs']) & set(result['found_drugs']))
+            expected += len(item['drugs'])
+
+    summary = summarize(latencies)
+    summary['stage_mean_ms'] = {stage: round(total / len(latencies) * 1000.0, 3) for stage, total in sorted(stage_totals.items())}
+    summary['drug_recall'] = round(hits / expected, 4) if expected else 0.0
+    return summary
+
+
+def bench_batch(images, batch_size, repeat):
+    from predictor import predict_images
+
+    latencies = []
+    for _ in range(repeat):
+        for start in range(0, len(images) - batch_size + 1, batch_size):
+            batch = [io.BytesIO(item['image']) for item in images[start:start + batch_size]]
+            started = time.perf_counter()
+            predict_images(batch)
+            latencies.append(time.perf_counter() - started)
+    return summarize(latencies, items_per_call=batch_size)
+
+
+def bench_size(size_text, args):
+    """Every benchmark for one image size; run in a fresh process"""
+    entry = {'size': size_text}
+    if not args.skip_pipeline:
+        # Load the model up front so its cost is reported separately from latency
+        from model_loader import corrector_handle
+        started = time.perf_counter()
+        corrector_handle.get()
+        entry['model_load_seconds'] = round(time.perf_counter() - started, 3)
+
+    images = generate_image_set(args.images, parse_size(size_text), load_drug_names(), seed=args.seed)
+    entry['preprocess'] = bench_preprocess(images, args.repeat)
+    print(f"{size_text:>10}  preprocess p50 {entry['preprocess']['p50_ms']:.1f} ms", flush=True)
+
+    if not args.skip_pipeline:
+        entry['pipeline'] = bench_single(images, args.repeat)
+        print(f"{size_text:>10}  pipeline   p50 {entry['pipeline']['p50_ms']:.1f} ms  "
+              f"p95 {entry['pipeline']['p95_ms']:.1f} ms  recall {entry['pipeline']['drug_recall']:.2%}", flush=True)
+        entry['batches'] = {}
+        for batch_size in args.batch_sizes:
+            if batch_size > len(images):
+                continue
+            entry['batches'][str(batch_size)] = bench_batch(images, batch_size, args.repeat)
+            print(f"{size_text:>10}  batch {batch_size:<4} {entry['batches'][str(batch_size)]['throughput_per_s']:.2f} images/s", flush=True)
+
+    entry['peak_rss_mb'] = peak_rss_mb()
+    return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["800x600", "1600x1200", "3000x4000"], help="image sizes as WIDTHxHEIGHT")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--images", type=int, default=8, help="synthetic images per size")
+    parser.add_argument("--repeat", type=int, default=2, help="passes over each image set")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--skip-pipeline", action="store_true", help="only benchmark preprocessing (no Tesseract/BERT)")
+    parser.add_argument("--output", help="write the JSON report to this path")
+    args = parser.parse_args(argv)
+    for size_text in args.sizes:
+        try:
+            parse_size(size_text)
+        except ValueError:
+            parser.error(f"invalid size {size_text}, expected WIDTHxHEIGHT")
+
+    report = {
+        'commit': git_commit(),
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'machine': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'config': {
+            'seed': args.seed,
+            'images_per_size': args.images,
+            'repeat': args.repeat,
+            'env': {key: value for key, value in os.environ.items()
+                    if key.startswith(("BERT_", "INFERENCE_", "OMP_", "MKL_", "TORCH_", "PREPROCESS_", "OCR_"))}
+        },
+        'results': []
+    }
+
+    context = multiprocessing.get_context("spawn")
+    for size_text in args.sizes:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            report['results'].append(executor.submit(bench_size, size_text, args).result())
+
+    if not args.skip_pipeline:
+        report['model_load_seconds'] = report['results'][0]['model_load_seconds']
+    report['peak_rss_mb'] = max(entry['peak_rss_mb'] for entry in report['results'])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
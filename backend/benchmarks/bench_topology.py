@@ -0,0 +1,157 @@
+# benchmarks/bench_topology.py
+"""Sweep workers x threads splits of the inference pool for throughput.
+
+Every configuration starts an InferencePool (worker_pool.py) with that many
+workers and intra-op threads per worker, waits for the workers to load the
+model, then keeps them busy from 2 x workers client threads. A request is
+the BERT correction of a few synthetic prescription lines, the stage the
+thread settings matter most for; --stage pipeline sends synthetic images
+through OCR and correction instead. Run from the backend directory:
+
+    python -m benchmarks.bench_topology --output topology.json
+    python -m benchmarks.bench_topology --workers 1 2 4 --threads 1 2 4 --stage pipeline
+
+Serve the best split with INFERENCE_WORKERS and WORKER_TORCH_THREADS (see
+cpu_topology.py).
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_pipeline import git_commit, summarize
+from benchmarks.synthetic import generate_image_set, generate_text_pairs, load_drug_names
+
+
+def _correct(pairs):
+    """One correction request, run inside a pool worker"""
+    from eval_corrector import _words
+    from predictor import correct_words
+
+    for pair in pairs:
+        correct_words(_words(pair))
+    return len(pairs)
+
+
+def _powers_of_two(limit):
+    values = []
+    value = 1
+    while value <= limit:
+        values.append(value)
+        value *= 2
+    return values
+
+
+def splits(cpus, workers=None, threads=None, oversubscribe=False):
+    """(workers, threads) pairs to try, by default every power-of-two split that fits the cores"""
+    pairs = []
+    for worker_count in workers or _powers_of_two(cpus):
+        for thread_count in threads or _powers_of_two(cpus):
+            if oversubscribe or worker_count * thread_count <= cpus:
+                pairs.append((worker_count, thread_count))
+    return pairs
+
+
+def bench_split(workers, threads, requests, submit, interop_threads, pin):
+    from worker_pool import InferencePool
+
+    pool = InferencePool(workers, threads_per_worker=threads, interop_threads=interop_threads, pin=pin, timeout=600.0)
+    try:
+        pool.warm()
+        if not pool.is_ready():
+            raise RuntimeError(pool.status()['error'])
+        # A first request per worker pays for lazy allocations
+        with ThreadPoolExecutor(workers) as clients:
+            list(clients.map(lambda request: submit(pool, request), requests[:workers]))
+
+        def timed_call(request):
+            started = time.perf_counter()
+            submit(pool, request)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(2 * workers) as clients:
+            latencies = list(clients.map(timed_call, requests))
+        wall = time.perf_counter() - started
+        summary = summarize(latencies)
+        summary['throughput_per_s'] = round(len(requests) / wall, 3)
+        summary['ready_time_seconds'] = round(pool.status()['ready_time_seconds'], 3)
+        return summary
+    finally:
+        pool.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stage", choices=["correction", "pipeline"], default="correction")
+    parser.add_argument("--workers", nargs="+", type=int, help="worker counts to try (default: powers of two up to the core count)")
+    parser.add_argument("--threads", nargs="+", type=int, help="threads per worker to try (default: powers of two up to the core count)")
+    parser.add_argument("--interop-threads", type=int, default=1)
+    parser.add_argument("--pin", action="store_true", help="pin every worker to its own cores")
+    parser.add_argument("--oversubscribe", action="store_true", help="also try splits using more threads than cores")
+    parser.add_argument("--requests", type=int, default=64, help="requests per split")
+    parser.add_argument("--lines-per-request", type=int, default=4, help="correction lines per request")
+    parser.add_argument("--size", default="1600x1200", help="synthetic image size for --stage pipeline")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="write the JSON report to this path")
+    args = parser.parse_args(argv)
+
+    from cpu_topology import available_cpus
+    from worker_pool import _predict
+
+    cpus = len(available_cpus())
+    drug_names = load_drug_names()
+    if args.stage == "correction":
+        pairs = generate_text_pairs(args.requests * args.lines_per_request, drug_names, seed=args.seed)
+        requests = [pairs[i:i + args.lines_per_request] for i in range(0, len(pairs), args.lines_per_request)]
+        submit = lambda pool, request: pool.run(_correct, request)
+    else:
+        width, height = (int(value) for value in args.size.lower().split("x"))
+        requests = [item['image'] for item in generate_image_set(args.requests, (width, height), drug_names, seed=args.seed)]
+        submit = lambda pool, request: pool.run(_predict, request)
+
+    report = {
+        'commit': git_commit(),
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': cpus},
+        'config': {
+            'stage': args.stage,
+            'requests': args.requests,
+            'interop_threads': args.interop_threads,
+            'pin': args.pin,
+            'env': {key: value for key, value in os.environ.items() if key.startswith(("BERT_", "INFERENCE_", "OMP_", "MKL_", "OCR_"))}
+        },
+        'results': []
+    }
+
+    print(f"{cpus} cores, {args.stage}, {len(requests)} requests per split")
+    print(f"{'workers':>8}{'threads':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for workers, threads in splits(cpus, args.workers, args.threads, args.oversubscribe):
+        entry = {'workers': workers, 'threads': threads}
+        try:
+            entry.update(bench_split(workers, threads, requests, submit, args.interop_threads, args.pin))
+            print(f"{workers:>8}{threads:>9}{entry['throughput_per_s']:>10.2f}{entry['p50_ms']:>10.1f}{entry['p95_ms']:>10.1f}", flush=True)
+        except Exception as e:
+            entry['error'] = str(e)
+            print(f"{workers:>8}{threads:>9}  failed: {e}", flush=True)
+        report['results'].append(entry)
+
+    completed = [entry for entry in report['results'] if 'error' not in entry]
+    if completed:
+        best = max(completed, key=lambda entry: entry['throughput_per_s'])
+        report['best'] = {'workers': best['workers'], 'threads': best['threads']}
+        print(f"Best: INFERENCE_WORKERS={best['workers']} WORKER_TORCH_THREADS={best['threads']} "
+              f"({best['throughput_per_s']:.2f} requests/s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+# benchmarks/compare.py
+"""Compare two bench_pipeline.py reports and flag regressions.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 10
+
+Exits with status 1 if any p50/p95 latency grew, or throughput dropped,
+by more than --threshold percent.
+"""
+import argparse
+import json
+import sys
+
+LATENCY_KEYS = ("p50_ms", "p95_ms")
+
+
+def _change(before, after):
+    if not before:
+        return 0.0
+    return (after - before) / before * 100.0
+
+
+def _rows(baseline, current):
+    """Yield (label, metric, before, after, regression_sign) for comparable metrics"""
+    before_by_size = {entry['size']: entry for entry in baseline['results']}
+    for entry in current['results']:
+        before = before_by_size.get(entry['size'])
+        if before is None:
+            continue
+        for section in ("preprocess", "pipeline"):
+            if section in entry and section in before:
+                for key in LATENCY_KEYS:
+                    yield f"{entry['size']} {section}", key, before[section][key], entry[section][key], 1
+        for batch_size, stats in entry.get('batches', {}).items():
+            if batch_size in before.get('batches', {}):
+                yield (f"{entry['size']} batch {batch_size}", "throughput_per_s",
+                       before['batches'][batch_size]['throughput_per_s'], stats['throughput_per_s'], -1)
+        yield f"{entry['size']}", "peak_rss_mb", before['peak_rss_mb'], entry['peak_rss_mb'], 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed change in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"baseline {baseline.get('commit')} -> current {current.get('commit')}")
+    regressions = 0
+    for label, metric, before, after, sign in _rows(baseline, current):
+        change = _change(before, after)
+        regressed = change * sign > args.threshold
+        regressions += regressed
+        print(f"{label:<24}{metric:<18}{before:>12.2f}{after:>12.2f}{change:>+9.1f}%{'  REGRESSION' if regressed else ''}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
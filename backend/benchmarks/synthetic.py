@@ -0,0 +1,172 @@
+# benchmarks/synthetic.py
+"""Offline generator of synthetic prescriptions.
+
+Drug names from the formulary are rendered as prescription lines, then
+degraded with rotation, blur and Gaussian noise. generate_text_pairs
+produces the same lines as (noisy, clean) text with OCR-style character
+errors, for training and evaluating the corrector. Everything is driven by
+a seed so the same data is produced on every run and machine.
+"""
+import io
+import os
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+FONT_CANDIDATES = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "C:\\Windows\\Fonts\\arial.ttf",
+]
+DOSES = ["250mg", "500mg", "5mg", "10mg", "20mg", "100mg", "1g"]
+FREQUENCIES = ["once daily", "twice daily", "tid", "qid", "at night", "every 8 hours", "as needed"]
+PATIENTS = ["J. Smith", "A. Hassan", "M. Garcia", "L. Chen"]
+# Typical Tesseract confusions; none introduces whitespace or punctuation
+OCR_CONFUSIONS = {
+    "o": ["0", "c", "a"], "l": ["1", "i", "I"], "i": ["l", "1", "j"], "e": ["c", "o"],
+    "a": ["o", "e"], "s": ["5", "z"], "m": ["rn", "nn"], "n": ["h", "r"], "b": ["h", "6"],
+    "g": ["q", "9"], "t": ["f", "l"], "u": ["v", "n"], "c": ["e", "o"], "r": ["n"], "h": ["b", "n"]
+}
+
+
+# Stems and endings of common drug names, recombined into formularies of any size
+NAME_STEMS = [
+    "amox", "ampi", "azithro", "cef", "cipro", "clari", "doxy", "levo", "metro", "nitro", "para", "ibu",
+    "ator", "rosu", "simva", "prava", "losar", "valsar", "telmi", "enala", "lisino", "rami", "capto",
+    "meto", "ateno", "propra", "biso", "carve", "amlo", "nife", "dilti", "furo", "hydro", "chloro", "spirono",
+    "omep", "esomep", "panto", "lanso", "rani", "fluox", "sertra", "parox", "citalo", "venla", "dulox",
+    "gaba", "prega", "levet", "lamo", "carba", "vals", "predni", "dexa", "methyl", "insu", "glipi", "metfor"
+]
+NAME_INFIXES = ["", "", "", "ta", "ri", "lo", "xi", "do", "na", "mi", "ce", "zo"]
+NAME_ENDINGS = [
+    "cillin", "mycin", "floxacin", "cycline", "zole", "statin", "sartan", "pril", "olol", "dipine", "semide",
+    "thiazide", "lactone", "prazole", "tidine", "oxetine", "aline", "pram", "faxine", "pentin", "balin",
+    "racetam", "trigine", "mazepine", "solone", "methasone", "formin", "zide", "mol", "profen", "done", "pine"
+]
+
+
+def generate_drug_names(count, seed=0):
+    """count distinct lowercase drug-like names, for formularies larger than drug_list.txt"""
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        name = rng.choice(NAME_STEMS) + rng.choice(NAME_INFIXES) + rng.choice(NAME_ENDINGS)
+        # Numbered variants once the combinations run out, as in large formularies
+        if name in names:
+            name += str(rng.randint(2, 99))
+        names.add(name)
+    return sorted(names)
+
+
+def load_drug_names(path=None):
+    path = path or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "drug_list.txt")
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _font(size):
+    for candidate in FONT_CANDIDATES:
+        if os.path.exists(candidate):
+            return ImageFont.truetype(candidate, size)
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow without FreeType sizing support
+        return ImageFont.load_default()
+
+
+def render_prescription(drugs, size=(1600, 1200), seed=0, noise=8.0, blur=0.8, max_rotation=3.0):
+    """Return (png_bytes, lines) for a prescription listing drugs"""
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.new("L", size, color=255)
+    draw = ImageDraw.Draw(image)
+
+    # Text height scales with the page so every size has the same layout
+    font = _font(max(12, height // 30))
+    margin = width // 12
+    y = height // 10
+    lines = [f"Patient: {rng.choice(PATIENTS)}", "Rx:"]
+    for drug in drugs:
+        lines.append(f"{drug.capitalize()} {rng.choice(DOSES)} {rng.choice(FREQUENCIES)}")
+    lines.append("Dr. signature")
+
+    line_height = int(height / 30 * 1.6)
+    for line in lines:
+        draw.text((margin + rng.randint(-5, 5), y), line, fill=rng.randint(0, 60), font=font)
+        y += line_height
+        if y > height - line_height:
+            break
+
+    if max_rotation:
+        image = image.rotate(rng.uniform(-max_rotation, max_rotation), resample=Image.BICUBIC, fillcolor=255)
+    if blur:
+        image = image.filter(ImageFilter.GaussianBlur(radius=blur * height / 1200.0))
+    if noise:
+        pixels = np.asarray(image, dtype=np.float32)
+        pixels += np.random.default_rng(seed).normal(0.0, noise, pixels.shape)
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue(), lines
+
+
+def generate_image_set(count, size, drug_names, seed=0, drugs_per_image=3):
+    """Return a list of {'image': png_bytes, 'drugs': [...]} dicts"""
+    rng = random.Random(seed)
+    images = []
+    for index in range(count):
+        drugs = rng.sample(drug_names, min(drugs_per_image, len(drug_names)))
+        data, _ = render_prescription(drugs, size=size, seed=seed * 100003 + index)
+        images.append({'image': data, 'drugs': [drug.lower() for drug in drugs]})
+    return images
+
+
+def ocr_noise(word, rng, edits=1):
+    """Apply OCR-style character errors (confusions, drops, doubles) to one word"""
+    chars = list(word)
+    for _ in range(edits):
+        if len(chars) < 3:
+            break
+        position = rng.randrange(len(chars))
+        kind = rng.random()
+        lowered = chars[position].lower()
+        if kind < 0.7 and lowered in OCR_CONFUSIONS:
+            chars[position] = rng.choice(OCR_CONFUSIONS[lowered])
+        elif kind < 0.85:
+            del chars[position]
+        else:
+            chars.insert(position, chars[position])
+    return "".join(chars)
+
+
+def generate_text_pairs(count, drug_names, seed=0, word_noise=0.3):
+    """Return a list of {'clean', 'noisy', 'noisy_words', 'drugs'} prescription lines.
+
+    Every word is corrupted with probability word_noise, drug names always
+    are; noisy_words holds the whitespace-split indices of corrupted words.
+    """
+    rng = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        drug = rng.choice(drug_names)
+        words = f"{drug.capitalize()} {rng.choice(DOSES)} {rng.choice(FREQUENCIES)}".split()
+        noisy_words = []
+        noisy = []
+        for index, word in enumerate(words):
+            if index == 0 or rng.random() < word_noise:
+                corrupted = ocr_noise(word, rng, edits=rng.choice([1, 1, 2]))
+                if corrupted != word:
+                    noisy_words.append(index)
+                    word = corrupted
+            noisy.append(word)
+        pairs.append({
+            'clean': " ".join(words),
+            'noisy': " ".join(noisy),
+            'noisy_words': noisy_words,
+            'drugs': [drug.lower()]
+        })
+    return pairs
@@ -0,0 +1,36 @@
+# build_formulary.py
+"""Compile a formulary source (drug_list.txt format or drug_id<TAB>name TSV)
+into a memory-mapped .fidx index.
+
+    python build_formulary.py national_formulary.tsv formulary.fidx
+
+Point FORMULARY_PATH at the .fidx file. Rebuilding it in place (the file is
+written to a temp path and renamed) is picked up by workers running with
+FORMULARY_RELOAD_INTERVAL > 0, or by POST /api/admin/formulary/reload.
+"""
+import argparse
+import sys
+import time
+
+from drug_dictionary import DrugDictionary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="drug list or TSV formulary")
+    parser.add_argument("output", help="path of the .fidx index to write")
+    args = parser.parse_args(argv)
+
+    if not args.output.endswith(".fidx"):
+        parser.error("output must end with .fidx")
+
+    started = time.perf_counter()
+    dictionary = DrugDictionary.from_source(args.source)
+    dictionary.save_index(args.output)
+    print(f"Indexed {len(dictionary)} names for {dictionary.drug_count()} drugs into {args.output} "
+          f"in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+# compare_backends.py
+"""Compare inference backends of the BERT corrector on a fixed image set.
+
+Each backend runs in its own process so load time and peak memory are
+measured in isolation. Every image is OCRed once, then each backend runs the
+production matching and masked correction on the same OCR words; latency,
+peak RSS and agreement with the first backend (predicted text and matched
+drugs) are reported.
+
+    python compare_backends.py --images ./samples --backends fp32 int8 --output report.json
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _ocr_words(image_paths):
+    from predictor import preprocess_image, ocr_image
+
+    words = []
+    for path in image_paths:
+        with open(path, "rb") as f:
+            preprocessed = preprocess_image(io.BytesIO(f.read()))
+        words.append(ocr_image(preprocessed))
+    return words
+
+
+def _run_backend(backend, image_words, repeat):
+    os.environ["INFERENCE_BACKEND"] = backend
+    os.environ["BERT_BATCH_WINDOW_MS"] = "0"
+    rss_before = _peak_rss_mb()
+
+    import predictor
+    from benchmarks.bench_pipeline import percentile
+    from model_loader import corrector_handle
+
+    started = time.perf_counter()
+    corrector_handle.get()
+    load_time = time.perf_counter() - started
+
+    # Warm up once so lazy allocations are not counted as latency
+    for words in image_words:
+        if predictor.correct_words(words)['corrected']:
+            break
+
+    latencies = []
+    predictions = []
+    found_drugs = []
+    for _ in range(repeat):
+        predictions = []
+        found_drugs = []
+        for words in image_words:
+            started = time.perf_counter()
+            result = predictor.correct_words(words)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+            predictions.append(result['predicted_text'])
+            found_drugs.append(result['found_drugs'])
+
+    return {
+        'backend': backend,
+        'load_time_seconds': round(load_time, 3),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 3),
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3)
+        },
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'model_rss_mb': round(_peak_rss_mb() - rss_before, 1),
+        'predictions': predictions,
+        'found_drugs': found_drugs
+    }
+
+
+def _agreement(reference, result):
+    total = len(reference['predictions'])
+    same_text = sum(1 for a, b in zip(reference['predictions'], result['predictions']) if a == b)
+    same_drugs = sum(1 for a, b in zip(reference['found_drugs'], result['found_drugs']) if a == b)
+    return {
+        'predicted_text': round(same_text / total, 4) if total else 0.0,
+        'found_drugs': round(same_drugs / total, 4) if total else 0.0
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="directory of prescription images")
+    parser.add_argument("--backends", nargs="+", default=["fp32", "int8"], help="backends to compare, the first is the reference")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the image set per backend")
+    parser.add_argument("--output", help="write the full report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    image_paths = sorted(
+        os.path.join(args.images, name) for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not image_paths:
+        print(f"No images found in {args.images}", file=sys.stderr)
+        return 1
+
+    from ocr import words_to_text
+
+    image_words = _ocr_words(image_paths)
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for backend in args.backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(_run_backend, backend, image_words, args.repeat).result())
+
+    reference = results[0]
+    print(f"{len(image_paths)} images, reference backend: {reference['backend']}")
+    print(f"{'backend':<10}{'load s':>9}{'p50 ms':>10}{'p95 ms':>10}{'rss MB':>10}{'text agr':>10}{'drug agr':>10}")
+    for result in results:
+        result['agreement'] = _agreement(reference, result)
+        print(f"{result['backend']:<10}{result['load_time_seconds']:>9.2f}"
+              f"{result['latency_ms']['p50']:>10.1f}{result['latency_ms']['p95']:>10.1f}"
+              f"{result['peak_rss_mb']:>10.0f}{result['agreement']['predicted_text']:>10.2%}"
+              f"{result['agreement']['found_drugs']:>10.2%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            ocr_texts = [words_to_text(words) for words in image_words]
+            json.dump({'images': image_paths, 'ocr_texts': ocr_texts, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# convert_checkpoint.py
+"""Convert the corrector checkpoint to safetensors for fast, memory-mapped loading.
+
+With FAST_LOAD=1 (the default) load_eager_model builds the model on the meta
+device, so no weight is allocated or randomly initialized, and assigns the
+tensors of the safetensors copy to it without copying them. The copy is
+written to MODEL_CACHE_DIR on first load; run this at build time instead so
+the first start does not pay for the conversion.
+
+    python convert_checkpoint.py
+    python convert_checkpoint.py --compare --runs 3
+
+--compare times cold starts, each in a fresh process: importing torch and
+the BERT classes, then load_eager_model, with FAST_LOAD=0 (random init and
+torch.load of the .pth) and FAST_LOAD=1. With --backend int8 both load the
+FP32 weights and quantize them, and a third row loads the cached INT8
+weights (QUANTIZED_CACHE).
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _cold_start(fast_load, backend, quantized_cache=False):
+    os.environ["FAST_LOAD"] = "1" if fast_load else "0"
+    os.environ["QUANTIZED_CACHE"] = "1" if quantized_cache else "0"
+    started = time.perf_counter()
+    import torch
+    from transformers import BertConfig, BertForMaskedLM
+    imported = time.perf_counter()
+    from model_loader import load_eager_model
+    load_eager_model(backend)
+    loaded = time.perf_counter()
+    return {'import_seconds': imported - started, 'load_seconds': loaded - imported, 'total_seconds': loaded - started}
+
+
+def compare(backend, runs):
+    context = multiprocessing.get_context("spawn")
+    loaders = [("torch.load", False, False), ("safetensors", True, False)]
+    if backend == "int8":
+        loaders.append(("int8 cache", True, True))
+    results = {}
+    for name, fast_load, quantized_cache in loaders:
+        # The first load writes the INT8 cache, leave it out
+        warm_up = 1 if quantized_cache else 0
+        samples = []
+        for _ in range(runs + warm_up):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                samples.append(executor.submit(_cold_start, fast_load, backend, quantized_cache).result())
+        samples = samples[warm_up:]
+        results[name] = {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="output path, defaults to the cache file load_eager_model reads")
+    parser.add_argument("--force", action="store_true", help="convert even if the output exists")
+    parser.add_argument("--compare", action="store_true", help="time cold starts with and without the converted file")
+    parser.add_argument("--backend", choices=["fp32", "int8"], default="fp32", help="backend loaded by --compare")
+    parser.add_argument("--runs", type=int, default=3, help="cold starts per loader for --compare (median is reported)")
+    args = parser.parse_args(argv)
+    if args.compare and args.output:
+        parser.error("--compare measures the cache file load_eager_model reads, leave out --output")
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+
+    from model_loader import checkpoint_path, safetensors_cache_path, write_safetensors
+
+    output = args.output or safetensors_cache_path()
+    if args.force or not os.path.exists(output):
+        started = time.perf_counter()
+        write_safetensors(output)
+        print(f"Converted {checkpoint_path} to {output} in {time.perf_counter() - started:.1f}s "
+              f"({os.path.getsize(output) / 1e6:.1f} MB)")
+    else:
+        print(f"{output} is up to date")
+
+    if args.compare:
+        results = compare(args.backend, args.runs)
+        print(f"Cold start of the {args.backend} corrector, median of {args.runs}:")
+        print(f"{'loader':<14}{'imports s':>11}{'load s':>9}{'total s':>10}")
+        for name, result in results.items():
+            print(f"{name:<14}{result['import_seconds']:>11.2f}{result['load_seconds']:>9.2f}{result['total_seconds']:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
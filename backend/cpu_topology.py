@@ -0,0 +1,114 @@
+# cpu_topology.py
+"""CPU thread topology of the processes that run the corrector.
+
+Every model replica gets an equal share of the cores it can run on: that
+many intra-op threads for torch, OpenMP/MKL, ONNX Runtime and OpenCV, and a
+small inter-op pool. Replicas are counted as web processes (WEB_CONCURRENCY,
+as gunicorn reads it) times replicas per web process (INFERENCE_WORKERS
+pool workers, or 1 when inference runs inline), so several gunicorn workers
+each loading the model no longer all try to use every core.
+
+    WEB_CONCURRENCY=4 INFERENCE_WORKERS=0 -> 4 replicas, cores / 4 threads each
+    WEB_CONCURRENCY=1 INFERENCE_WORKERS=3 -> 3 replicas, cores / 3 threads each
+
+Set MODEL_REPLICAS when processes are confined to their own cpuset, since
+the split is over the cores this process may run on. Use
+benchmarks/bench_topology.py to find the best workers x threads split.
+"""
+import os
+import sys
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Replicas sharing this process's cores, 0 derives it as described above
+MODEL_REPLICAS = int(os.getenv("MODEL_REPLICAS", "0"))
+# Intra-op threads per replica, 0 splits the available cores evenly
+WORKER_TORCH_THREADS = int(os.getenv("WORKER_TORCH_THREADS", "0"))
+# Inter-op threads per replica; BERT inference has little to run in parallel
+WORKER_INTEROP_THREADS = int(os.getenv("WORKER_INTEROP_THREADS", "1"))
+# Pin every pool worker to its own disjoint set of cores
+WORKER_CPU_AFFINITY = os.getenv("WORKER_CPU_AFFINITY", "0") == "1"
+
+# Settings applied in this process, see configure()
+applied = {}
+# Thread counts OpenMP, MKL and OpenBLAS read at import
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def available_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def replica_count(inference_workers=None):
+    if MODEL_REPLICAS > 0:
+        return MODEL_REPLICAS
+    if inference_workers is None:
+        inference_workers = int(os.getenv("INFERENCE_WORKERS", "0"))
+    return WEB_CONCURRENCY * max(1, inference_workers)
+
+
+def threads_per_replica(replicas=None):
+    """Intra-op threads each replica should use"""
+    if WORKER_TORCH_THREADS > 0:
+        return WORKER_TORCH_THREADS
+    return max(1, len(available_cpus()) // (replicas or replica_count()))
+
+
+def replica_cpus(index, replicas, cpus=None):
+    """Disjoint share of cpus for replica index (of replicas)"""
+    cpus = cpus or available_cpus()
+    share = max(1, len(cpus) // replicas)
+    start = (index % replicas) * share
+    return cpus[start:start + share] or cpus
+
+
+def _configure_torch():
+    import torch
+    torch.set_num_threads(applied['threads'])
+    try:
+        torch.set_num_interop_threads(applied['interop_threads'])
+    except RuntimeError:
+        # Inter-op parallelism already started, keep torch's pool
+        applied['interop_threads'] = torch.get_num_interop_threads()
+    applied['torch'] = True
+
+
+def configure(threads=None, interop_threads=None, cpus=None, use_torch=None):
+    """Apply the thread topology to this process, once.
+
+    Call before torch runs anything: OpenMP reads its environment when
+    torch is imported, and inter-op threads can only be set before the
+    first parallel operation. torch itself is only configured if it is
+    already imported or use_torch is set, so the onnx backend never
+    imports it; a later call with use_torch=True configures it with the
+    settings in effect. Later calls return those settings.
+    """
+    if not applied:
+        threads = threads or threads_per_replica()
+        if cpus and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        # Explicit settings in the environment win
+        for name in THREAD_ENV_VARS:
+            os.environ.setdefault(name, str(threads))
+
+        try:
+            import cv2
+            cv2.setNumThreads(threads)
+        except ImportError:
+            pass
+
+        applied.update({
+            'threads': threads,
+            'interop_threads': interop_threads or WORKER_INTEROP_THREADS,
+            'cpus': cpus or available_cpus(),
+            'replicas': replica_count(),
+            'torch': False
+        })
+
+    if use_torch is None:
+        use_torch = "torch" in sys.modules
+    if use_torch and not applied['torch']:
+        _configure_torch()
+    return applied
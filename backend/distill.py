@@ -0,0 +1,222 @@
+# distill.py
+"""Distil the BERT corrector into a small 2-4 layer student, on CPU.
+
+Training data are synthetic (noisy, clean) prescription lines generated
+offline from drug_list.txt (see benchmarks/synthetic.py). As at inference,
+the tokens of corrupted words are replaced by [MASK]. The student learns
+from the teacher's softened output distribution and from the clean tokens.
+Only the tokenizer's own ids are scored, since the other logits of the
+30522-wide head can never be decoded.
+
+The student starts from the teacher: its embeddings, MLM head and evenly
+spaced encoder layers. With --intermediate-size it also keeps only the
+feed-forward neurons with the largest weights.
+
+    python distill.py --output student --layers 3 --pairs 20000 --epochs 2
+
+The output directory holds config.json, the tokenizer files and
+bert_ocr_model.pth. Serve it with
+
+    CORRECTOR_TOKENIZER_DIR=student CORRECTOR_CHECKPOINT=student/bert_ocr_model.pth
+
+and compare it with the teacher using eval_corrector.py.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import time
+
+TOKENIZER_FILES = ("tokenizer.json", "vocab.txt", "special_tokens_map.json", "tokenizer_config.json")
+
+
+def _layer_map(teacher_layers, student_layers):
+    """Evenly spaced teacher layers, always including the first and the last"""
+    if student_layers == 1:
+        return [teacher_layers - 1]
+    return [round(i * (teacher_layers - 1) / (student_layers - 1)) for i in range(student_layers)]
+
+
+def build_student(teacher, layers, intermediate_size=None):
+    from transformers import BertConfig, BertForMaskedLM
+
+    config = BertConfig.from_dict(teacher.config.to_dict())
+    config.num_hidden_layers = layers
+    config.intermediate_size = intermediate_size or teacher.config.intermediate_size
+    student = BertForMaskedLM(config)
+
+    teacher_state = teacher.state_dict()
+    state = {}
+    layer_map = _layer_map(teacher.config.num_hidden_layers, layers)
+    for name in student.state_dict():
+        source = name
+        if name.startswith("bert.encoder.layer."):
+            parts = name.split(".")
+            parts[3] = str(layer_map[int(parts[3])])
+            source = ".".join(parts)
+        state[name] = teacher_state[source].clone()
+
+    if config.intermediate_size != teacher.config.intermediate_size:
+        # Keep the feed-forward neurons with the largest input weights
+        for index in range(layers):
+            prefix = f"bert.encoder.layer.{index}."
+            weight = state[prefix + "intermediate.dense.weight"]
+            keep = weight.norm(dim=1).topk(config.intermediate_size).indices.sort().values
+            state[prefix + "intermediate.dense.weight"] = weight[keep].clone()
+            state[prefix + "intermediate.dense.bias"] = state[prefix + "intermediate.dense.bias"][keep].clone()
+            state[prefix + "output.dense.weight"] = state[prefix + "output.dense.weight"][:, keep].clone()
+
+    student.load_state_dict(state)
+    return student
+
+
+def encode_pairs(pairs, tokenizer, max_length):
+    """(masked noisy ids, clean ids) per pair; pairs whose tokens do not line up are dropped"""
+    examples = []
+    for pair in pairs:
+        noisy_ids, offsets = tokenizer.encode_offsets(pair['noisy'])
+        clean_ids, _ = tokenizer.encode_offsets(pair['clean'])
+        if len(noisy_ids) != len(clean_ids) or len(noisy_ids) > max_length:
+            continue
+
+        # Character spans of the corrupted words in the noisy line
+        spans = []
+        start = 0
+        for index, word in enumerate(pair['noisy'].split(" ")):
+            if index in pair['noisy_words']:
+                spans.append((start, start + len(word)))
+            start += len(word) + 1
+        masked = list(noisy_ids)
+        for column, (first, last) in enumerate(offsets):
+            if last > first and any(first >= span_start and last <= span_end for span_start, span_end in spans):
+                masked[column] = tokenizer.mask_token_id
+        examples.append((masked, clean_ids))
+    return examples
+
+
+def distillation_loss(student_logits, teacher_logits, labels, attention_mask, temperature, alpha):
+    import torch.nn.functional as F
+
+    mask = attention_mask.bool()
+    student_logits = student_logits[mask]
+    teacher_logits = teacher_logits[mask]
+    soft = F.kl_div(
+        F.log_softmax(student_logits / temperature, dim=-1),
+        F.softmax(teacher_logits / temperature, dim=-1),
+        reduction="batchmean"
+    ) * temperature * temperature
+    hard = F.cross_entropy(student_logits, labels[mask])
+    return alpha * soft + (1.0 - alpha) * hard
+
+
+def train(teacher, student, examples, tokenizer, epochs, batch_size, lr, temperature, alpha, seed, log_every=50):
+    import torch
+
+    vocab = tokenizer.vocab_size
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr)
+    rng = random.Random(seed)
+    teacher.eval()
+    student.train()
+    step = 0
+    for epoch in range(epochs):
+        rng.shuffle(examples)
+        started = time.perf_counter()
+        running = 0.0
+        for start in range(0, len(examples), batch_size):
+            chunk = examples[start:start + batch_size]
+            batch = {name: torch.from_numpy(array) for name, array in tokenizer.pad([ids for ids, _ in chunk]).items()}
+            labels = torch.from_numpy(tokenizer.pad([clean for _, clean in chunk])['input_ids'])
+
+            with torch.no_grad():
+                teacher_logits = teacher(**batch).logits[..., :vocab]
+            student_logits = student(**batch).logits[..., :vocab]
+            loss = distillation_loss(student_logits, teacher_logits, labels, batch['attention_mask'], temperature, alpha)
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            step += 1
+            running += loss.item()
+            if step % log_every == 0:
+                print(f"epoch {epoch + 1} step {step} loss {running / log_every:.4f} "
+                      f"({(time.perf_counter() - started) / (start // batch_size + 1) * 1000:.0f} ms/step)", flush=True)
+                running = 0.0
+    student.eval()
+    return student
+
+
+def save_student(student, tokenizer_dir, output):
+    import torch
+
+    os.makedirs(output, exist_ok=True)
+    for name in TOKENIZER_FILES:
+        source = os.path.join(tokenizer_dir, name)
+        if os.path.exists(source):
+            shutil.copyfile(source, os.path.join(output, name))
+    student.config.to_json_file(os.path.join(output, "config.json"))
+    tmp_path = os.path.join(output, "bert_ocr_model.pth.tmp")
+    torch.save(student.state_dict(), tmp_path)
+    os.replace(tmp_path, os.path.join(output, "bert_ocr_model.pth"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="directory for the student checkpoint and tokenizer")
+    parser.add_argument("--layers", type=int, default=3, choices=[1, 2, 3, 4, 5, 6])
+    parser.add_argument("--intermediate-size", type=int, help="feed-forward width of the student (default: teacher's)")
+    parser.add_argument("--pairs", type=int, default=20000, help="synthetic training lines")
+    parser.add_argument("--pairs-file", help="JSONL of {'clean', 'noisy', 'noisy_words'} lines to train on instead")
+    parser.add_argument("--save-pairs", help="write the generated training lines to this JSONL file")
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=1e-4)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--alpha", type=float, default=0.5, help="weight of the distillation loss against the clean-token loss")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads (0 = torch default)")
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    import torch
+    from benchmarks.synthetic import generate_text_pairs, load_drug_names
+    from model_loader import load_eager_model, tokenizer_path
+    from runtimes import CorrectorTokenizer
+
+    torch.manual_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    if args.pairs_file:
+        with open(args.pairs_file) as f:
+            pairs = [json.loads(line) for line in f if line.strip()]
+    else:
+        pairs = generate_text_pairs(args.pairs, load_drug_names(), seed=args.seed)
+    if args.save_pairs:
+        with open(args.save_pairs, "w") as f:
+            for pair in pairs:
+                f.write(json.dumps(pair) + "\n")
+
+    tokenizer = CorrectorTokenizer(tokenizer_path)
+    examples = encode_pairs(pairs, tokenizer, max_length=128)
+    print(f"{len(examples)} of {len(pairs)} lines usable for training")
+    if not examples:
+        return 1
+
+    teacher = load_eager_model("fp32")
+    student = build_student(teacher, args.layers, args.intermediate_size)
+    teacher_params = sum(p.numel() for p in teacher.parameters())
+    student_params = sum(p.numel() for p in student.parameters())
+    print(f"teacher {teacher_params / 1e6:.1f}M parameters, student {student_params / 1e6:.1f}M")
+
+    started = time.perf_counter()
+    train(teacher, student, examples, tokenizer, args.epochs, args.batch_size, args.lr, args.temperature, args.alpha, args.seed)
+    print(f"Trained in {time.perf_counter() - started:.0f}s")
+
+    save_student(student, tokenizer_path, args.output)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+# drug_dictionary.py
+"""Drug formulary storage, synonym resolution and hot reload.
+
+A formulary source is either the plain drug_list.txt format (one name per
+line, every name its own drug) or a TSV of `drug_id<TAB>name` rows where
+every row sharing a drug_id is a synonym (brand, generic, strength form) and
+the first row is the canonical name. Lines starting with '#' are ignored.
+Names may span several words ("amoxicillin 500 mg"); max_words is the
+longest, so callers know how many OCR words to try as one name.
+
+Names are kept in flat UTF-8 blobs with uint32 offset arrays instead of
+Python lists of strings, and can be compiled to a .fidx file (see
+build_formulary.py) that is memory-mapped so the OS shares its pages between
+worker processes.
+"""
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+from drug_matcher import DrugMatcher
+
+INDEX_MAGIC = b"FIDX0001"
+
+
+def _uint32_array(values):
+    return array("I", values)
+
+
+class StringTable:
+    """Immutable sequence of strings stored as one UTF-8 blob plus offsets"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = [0]
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        return cls(b"".join(encoded), _uint32_array(offsets))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("string table index out of range")
+        return bytes(self._blob[self._offsets[index]:self._offsets[index + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def find_sorted(self, value):
+        """Index of value in a sorted table, or None"""
+        index = bisect_left(self, value)
+        if index < len(self) and self[index] == value:
+            return index
+        return None
+
+
+class PostingTable:
+    """Token -> sorted name indices, as consumed by DrugMatcher"""
+
+    def __init__(self, tokens, offsets, values):
+        self.tokens = tokens
+        self._offsets = offsets
+        self._values = values
+        self._index = {token: i for i, token in enumerate(tokens)}
+
+    @classmethod
+    def from_names(cls, names):
+        postings = {}
+        for index, name in enumerate(names):
+            for token in DrugMatcher.tokens(name):
+                postings.setdefault(token, []).append(index)
+        tokens = sorted(postings)
+        offsets = [0]
+        values = _uint32_array([])
+        for token in tokens:
+            values.extend(postings[token])
+            offsets.append(len(values))
+        return cls(StringTable.from_strings(tokens), _uint32_array(offsets), values)
+
+    def get(self, token, default=()):
+        i = self._index.get(token)
+        if i is None:
+            return default
+        return self._values[self._offsets[i]:self._offsets[i + 1]]
+
+
+def _parse_source(path):
+    """Return (drug_ids, canonical_names, synonyms) where synonyms maps lowercased name -> drug index"""
+    drug_ids = []
+    canonical = []
+    drug_index = {}
+    synonyms = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "\t" in line:
+                drug_id, name = [part.strip() for part in line.split("\t", 2)[:2]]
+            else:
+                drug_id, name = line.lower(), line
+            name = " ".join(name.lower().split())
+            if not name:
+                continue
+            if drug_id not in drug_index:
+                drug_index[drug_id] = len(drug_ids)
+                drug_ids.append(drug_id)
+                canonical.append(name)
+            # First drug claiming a name wins, as with duplicate list entries
+            synonyms.setdefault(name, drug_index[drug_id])
+    return drug_ids, canonical, synonyms
+
+
+class DrugDictionary:
+    def __init__(self, names, name_drug, drug_ids, canonical, postings, source=None, max_words=None):
+        self.names = names
+        self.name_drug = name_drug
+        self.drug_ids = drug_ids
+        self.canonical = canonical
+        self.postings = postings
+        self.source = source
+        if max_words is None:
+            max_words = max((len(name.split()) for name in names), default=1)
+        self.max_words = max_words
+
+    @classmethod
+    def from_source(cls, path):
+        drug_ids, canonical, synonyms = _parse_source(path)
+        sorted_names = sorted(synonyms)
+        names = StringTable.from_strings(sorted_names)
+        return cls(
+            names,
+            _uint32_array(synonyms[name] for name in sorted_names),
+            StringTable.from_strings(drug_ids),
+            StringTable.from_strings(canonical),
+            PostingTable.from_names(sorted_names),
+            source=path
+        )
+
+    @classmethod
+    def load(cls, path):
+        if path.endswith(".fidx"):
+            return cls.from_index(path)
+        return cls.from_source(path)
+
+    def __len__(self):
+        return len(self.names)
+
+    def drug_count(self):
+        return len(self.drug_ids)
+
+    def lookup(self, name):
+        """Exact lookup of a lowercased name, returns its name index or None"""
+        return self.names.find_sorted(name)
+
+    def resolve(self, name):
+        """Return (drug_id, canonical_name) for a name in the dictionary, or None"""
+        index = self.lookup(name)
+        if index is None:
+            return None
+        drug = self.name_drug[index]
+        return self.drug_ids[drug], self.canonical[drug]
+
+    def make_matcher(self, cutoff=0.75):
+        return DrugMatcher(self.names, cutoff=cutoff, postings=self.postings)
+
+    # Prebuilt index files
+
+    def _sections(self):
+        return {
+            'names.blob': self.names._blob,
+            'names.offsets': self.names._offsets,
+            'name_drug': self.name_drug,
+            'drug_ids.blob': self.drug_ids._blob,
+            'drug_ids.offsets': self.drug_ids._offsets,
+            'canonical.blob': self.canonical._blob,
+            'canonical.offsets': self.canonical._offsets,
+            'tokens.blob': self.postings.tokens._blob,
+            'tokens.offsets': self.postings.tokens._offsets,
+            'postings.offsets': self.postings._offsets,
+            'postings.values': self.postings._values
+        }
+
+    def save_index(self, path):
+        """Write a .fidx file: magic, header length, JSON header, then 8-byte aligned sections"""
+        payloads = {name: bytes(section) if isinstance(section, (bytes, memoryview)) else section.tobytes()
+                    for name, section in self._sections().items()}
+        layout = {}
+        position = 0
+        for name, payload in payloads.items():
+            layout[name] = [position, len(payload)]
+            position += len(payload) + (-len(payload) % 8)
+        header = json.dumps({'byteorder': sys.byteorder, 'max_words': self.max_words, 'sections': layout}).encode("utf-8")
+        header += b" " * (-(len(INDEX_MAGIC) + 4 + len(header)) % 8)
+        data_start = len(INDEX_MAGIC) + 4 + len(header)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(INDEX_MAGIC)
+            f.write(len(header).to_bytes(4, "little"))
+            f.write(header)
+            for name, payload in payloads.items():
+                f.seek(data_start + layout[name][0])
+                f.write(payload)
+            f.write(b"\0" * (-f.tell() % 8))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def from_index(cls, path):
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        if bytes(view[:len(INDEX_MAGIC)]) != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a formulary index")
+        header_len = int.from_bytes(view[len(INDEX_MAGIC):len(INDEX_MAGIC) + 4], "little")
+        header_start = len(INDEX_MAGIC) + 4
+        header = json.loads(bytes(view[header_start:header_start + header_len]).decode("utf-8"))
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was built on a {header['byteorder']}-endian machine")
+        data_start = header_start + header_len
+
+        def section(name, uint32=False):
+            offset, length = header['sections'][name]
+            data = view[data_start + offset:data_start + offset + length]
+            return data.cast("I") if uint32 else data
+
+        def strings(prefix):
+            return StringTable(section(f"{prefix}.blob"), section(f"{prefix}.offsets", uint32=True))
+
+        return cls(
+            strings("names"),
+            section("name_drug", uint32=True),
+            strings("drug_ids"),
+            strings("canonical"),
+            PostingTable(strings("tokens"), section("postings.offsets", uint32=True), section("postings.values", uint32=True)),
+            source=path,
+            # Indexes built before multi-word matching are scanned once for it
+            max_words=header.get('max_words')
+        )
+
+
+Formulary = namedtuple("Formulary", ["dictionary", "matcher", "path", "mtime", "loaded_at", "load_time"])
+
+
+class FormularyStore:
+    """Holds the current Formulary and swaps in a new one atomically on reload.
+
+    Readers call current() once per request and use that snapshot, so a reload
+    never mixes dictionaries within a prediction. With check_interval > 0,
+    current() also compares the source file's mtime at most that often and
+    reloads on change, so every process sharing the file follows a reload.
+    """
+
+    def __init__(self, path, cutoff=0.75, check_interval=0.0):
+        self.path = path
+        self.cutoff = cutoff
+        self.check_interval = check_interval
+        self._next_check = time.monotonic() + check_interval
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._last_error = None
+        self._current = self._build()
+
+    def _build(self):
+        started = time.perf_counter()
+        mtime = os.path.getmtime(self.path)
+        dictionary = DrugDictionary.load(self.path)
+        matcher = dictionary.make_matcher(self.cutoff)
+        return Formulary(dictionary, matcher, self.path, mtime, time.time(), time.perf_counter() - started)
+
+    def current(self):
+        if self.check_interval > 0 and time.monotonic() >= self._next_check:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                self.reload(force=False)
+            except Exception:
+                # Keep serving the previous formulary, status() reports the error
+                pass
+        return self._current
+
+    def reload(self, force=True):
+        """Rebuild from disk and swap it in. Returns True if a new formulary was installed."""
+        with self._reload_lock:
+            try:
+                if not force and os.path.getmtime(self.path) == self._current.mtime:
+                    return False
+                formulary = self._build()
+            except Exception as e:
+                # Keep serving the previous formulary
+                self._last_error = str(e)
+                raise
+            self._last_error = None
+            self._current = formulary
+            return True
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload(force=False)
+            except Exception:
+                pass
+
+    def start_watcher(self, interval):
+        """Poll the source file's mtime every interval seconds and reload on change"""
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="formulary-watcher", daemon=True)
+        self._watcher.start()
+
+    def restart_watcher(self, interval):
+        """start_watcher in a forked child, which inherits the watcher attribute but not its thread"""
+        # The lock may have been held by the parent's watcher at the fork
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self.start_watcher(interval)
+
+    def status(self):
+        formulary = self._current
+        return {
+            'path': formulary.path,
+            'names': len(formulary.dictionary),
+            'drugs': formulary.dictionary.drug_count(),
+            'max_words': formulary.dictionary.max_words,
+            'loaded_at': formulary.loaded_at,
+            'load_time_seconds': round(formulary.load_time, 4),
+            'watching': self._watcher is not None,
+            'check_interval': self.check_interval,
+            'last_error': self._last_error
+        }
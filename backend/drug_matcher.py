@@ -0,0 +1,100 @@
+# drug_matcher.py
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+import numpy as np
+
+
+class DrugMatcher:
+    """Approximate drug-name lookup equivalent to difflib.get_close_matches(word, names, n=1, cutoff).
+
+    difflib scores every name with SequenceMatcher. Here names are indexed by
+    character occurrence tokens ("a" for the first 'a', "a2" for the second,
+    ...), so the number of tokens a word and a name share is exactly the
+    upper bound difflib's quick_ratio uses. Counting the word's posting lists
+    with one bincount gives that number for every name at once; only names
+    whose count and length can still reach the cutoff (quick_ratio and
+    real_quick_ratio) are scored with SequenceMatcher exactly as difflib
+    does. The returned match is therefore the same as difflib's, while the
+    names scored stay a small fraction of a large formulary.
+    """
+
+    def __init__(self, names, cutoff=0.75, cache_size=8192, postings=None):
+        """names may be any sequence; with prebuilt postings (see
+        drug_dictionary.PostingTable) it must already be sorted and unique."""
+        self.cutoff = cutoff
+        if postings is None:
+            self.names = sorted(set(names))
+            lists = {}
+            for index, name in enumerate(self.names):
+                for token in self.tokens(name):
+                    lists.setdefault(token, []).append(index)
+            self._postings = {token: np.array(indices, dtype=np.uint32) for token, indices in lists.items()}
+        else:
+            self.names = names
+            self._postings = postings
+        self._lengths = np.fromiter((len(name) for name in self.names), dtype=np.int32, count=len(self.names))
+        self.best_match = lru_cache(maxsize=cache_size)(self._best_match)
+
+    @staticmethod
+    def tokens(text):
+        seen = {}
+        tokens = []
+        for ch in text:
+            count = seen.get(ch, 0) + 1
+            seen[ch] = count
+            tokens.append(ch if count == 1 else f"{ch}{count}")
+        return tokens
+
+    def _posting(self, token):
+        indices = self._postings.get(token, ())
+        if isinstance(indices, np.ndarray):
+            return indices
+        # PostingTable slices are uint32 arrays or memoryviews, viewed without copying
+        return np.frombuffer(indices, dtype=np.uint32) if len(indices) else np.empty(0, dtype=np.uint32)
+
+    def _candidates(self, word):
+        """Indices of the names that can reach the cutoff against word"""
+        cutoff = self.cutoff
+        if cutoff <= 0:
+            return range(len(self.names))
+
+        postings = [self._posting(token) for token in self.tokens(word)]
+        postings = [indices for indices in postings if len(indices)]
+        if not postings:
+            return ()
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.names))
+
+        # quick_ratio = 2 * shared / (len(word) + len(name)) and
+        # real_quick_ratio = 2 * min(lengths) / (len(word) + len(name))
+        length = len(word)
+        lengths = self._lengths
+        needed = np.ceil(cutoff * (length + lengths) / 2.0 - 1e-6)
+        keep = (shared >= needed) & (2.0 * np.minimum(lengths, length) >= cutoff * (length + lengths) - 1e-6)
+        return np.flatnonzero(keep).tolist()
+
+    def _best_match(self, word):
+        """Return (name, similarity) for the closest name at or above the cutoff, else None"""
+        if not word:
+            return None
+
+        matcher = SequenceMatcher()
+        matcher.set_seq2(word)
+        best = None
+        for index in self._candidates(word):
+            matcher.set_seq1(self.names[index])
+            if matcher.real_quick_ratio() >= self.cutoff and \
+               matcher.quick_ratio() >= self.cutoff:
+                score = matcher.ratio()
+                # Same ordering as get_close_matches: highest score, then highest name
+                if score >= self.cutoff and (best is None or (score, self.names[index]) > best):
+                    best = (score, self.names[index])
+
+        if best is None:
+            return None
+        # Confidence has always been reported as SequenceMatcher(word, match)
+        return best[1], SequenceMatcher(None, word, best[1]).ratio()
+
+    def candidate_count(self, word):
+        """Number of names best_match scores for word, for benchmarks"""
+        return len(self._candidates(word)) if word else 0
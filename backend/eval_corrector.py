@@ -0,0 +1,130 @@
+# eval_corrector.py
+"""Compare corrector checkpoints (e.g. the teacher and a distilled student) on drug recall and latency.
+
+Every model corrects the same held-out synthetic prescription lines through
+the production path: formulary matching, masked correction of the
+corrupted words (given a low OCR confidence), then matching the
+corrections. Each model runs in its own process on CPU.
+
+    python eval_corrector.py --models default student --samples 1000 --output eval.json
+
+'default' is the shipped checkpoint; any other name is a directory written
+by distill.py.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+# Confidences given to the clean and the corrupted words of a line
+CLEAN_CONFIDENCE = 95.0
+NOISY_CONFIDENCE = 40.0
+
+
+def _words(pair):
+    return [
+        {
+            'text': text,
+            'confidence': NOISY_CONFIDENCE if index in pair['noisy_words'] else CLEAN_CONFIDENCE,
+            'box': [0, 0, 0, 0], 'block': 0, 'line': 0, 'page': 0
+        }
+        for index, text in enumerate(pair['noisy'].split())
+    ]
+
+
+def _run_model(model, backend, pairs, threads):
+    if model != "default":
+        os.environ["CORRECTOR_TOKENIZER_DIR"] = model
+        os.environ["CORRECTOR_CHECKPOINT"] = os.path.join(model, "bert_ocr_model.pth")
+    os.environ["INFERENCE_BACKEND"] = backend
+    os.environ["BERT_BATCH_WINDOW_MS"] = "0"
+    if threads:
+        # Before the model loads, which would apply this process's share of the cores
+        from cpu_topology import configure
+        configure(threads=threads)
+
+    import predictor
+    from benchmarks.bench_pipeline import percentile
+    from model_loader import corrector_handle
+
+    started = time.perf_counter()
+    loaded = corrector_handle.get()
+    load_time = time.perf_counter() - started
+    model_object = getattr(loaded.runtime, "model", None)
+    parameters = sum(p.numel() for p in model_object.parameters()) if model_object is not None else None
+
+    latencies = []
+    hits_before = hits_after = expected = corrected = 0
+    predictions = []
+    for index, pair in enumerate(pairs):
+        started = time.perf_counter()
+        result = predictor.correct_words(_words(pair))
+        if result['corrected']:
+            # The first correction pays for lazy allocations, leave it out
+            if index:
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            corrected += 1
+        drugs = set(pair['drugs'])
+        hits_before += len(drugs.intersection(result['matched_drugs']))
+        hits_after += len(drugs.intersection(result['found_drugs']))
+        expected += len(drugs)
+        predictions.append(result['predicted_text'])
+
+    return {
+        'model': model,
+        'backend': backend,
+        'parameters': parameters,
+        'load_time_seconds': round(load_time, 3),
+        'corrected_lines': corrected,
+        'recall_without_correction': round(hits_before / expected, 4) if expected else 0.0,
+        'recall': round(hits_after / expected, 4) if expected else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3)
+        },
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, 1),
+        'predictions': predictions
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["default"], help="'default' or distill.py output directories")
+    parser.add_argument("--backend", default="fp32", help="inference backend for every model")
+    parser.add_argument("--samples", type=int, default=1000, help="synthetic evaluation lines")
+    parser.add_argument("--seed", type=int, default=4321, help="keep different from the training seed")
+    parser.add_argument("--threads", type=int, default=0, help="threads per model (0 = the share of the cores cpu_topology.py gives the process)")
+    parser.add_argument("--output", help="write the full report as JSON to this path")
+    args = parser.parse_args(argv)
+
+    from benchmarks.synthetic import generate_text_pairs, load_drug_names
+    pairs = generate_text_pairs(args.samples, load_drug_names(), seed=args.seed)
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for model in args.models:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(_run_model, model, args.backend, pairs, args.threads).result())
+
+    print(f"{len(pairs)} lines, backend {args.backend}")
+    print(f"{'model':<24}{'params M':>10}{'load s':>9}{'p50 ms':>10}{'p95 ms':>10}{'recall':>10}{'no BERT':>10}")
+    for result in results:
+        parameters = f"{result['parameters'] / 1e6:.1f}" if result['parameters'] else "-"
+        print(f"{result['model']:<24}{parameters:>10}{result['load_time_seconds']:>9.2f}"
+              f"{result['latency_ms']['p50']:>10.1f}{result['latency_ms']['p95']:>10.1f}"
+              f"{result['recall']:>10.2%}{result['recall_without_correction']:>10.2%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'pairs': pairs, 'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+# export_model.py
+"""Export the BERT corrector to ONNX or TorchScript for graph runtimes.
+
+The exported graph takes input_ids, attention_mask and token_type_ids with
+dynamic batch and sequence axes and returns the MLM logits. Serve it with
+INFERENCE_BACKEND=onnx or INFERENCE_BACKEND=torchscript. With
+--output-vocab tokenizer the graph ends in the sub-vocabulary head (see
+output_vocab.py) and its ids are written next to it as <output>.vocab.json.
+
+    python export_model.py --format onnx
+    python export_model.py --format torchscript --source int8
+    python export_model.py --format onnx --output-vocab tokenizer
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import torch
+
+from model_loader import (
+    BERT_OUTPUT_VOCAB, ONNX_MODEL_PATH, TORCHSCRIPT_MODEL_PATH, tokenizer_path, load_eager_model, load_output_head
+)
+from output_vocab import OUTPUT_VOCABS
+from runtimes import CorrectorTokenizer, TorchRuntime, OnnxRuntime, TorchScriptRuntime, output_ids_path
+
+INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+SAMPLE_TEXTS = ["amoxicilin 500mg tid", "paracetamol", "take ibuprofen 400 mg twice daily after meals"]
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Positional inputs and a plain tensor output, as tracing and ONNX export expect"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids, return_dict=False)[0]
+
+
+class _SubVocabLogits(torch.nn.Module):
+    """Encoder, MLM transform and the sliced decoder rows only"""
+
+    def __init__(self, model, weight, bias):
+        super().__init__()
+        self.model = model
+        self.weight = torch.nn.Parameter(weight, requires_grad=False)
+        self.bias = torch.nn.Parameter(bias, requires_grad=False)
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        hidden = self.model.bert(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids, return_dict=False)[0]
+        return torch.nn.functional.linear(self.model.cls.predictions.transform(hidden), self.weight, self.bias)
+
+
+def _example_inputs(tokenizer):
+    batch = tokenizer.pad(tokenizer.encode_batch(SAMPLE_TEXTS, max_length=128))
+    return batch, tuple(torch.from_numpy(batch[name]) for name in INPUT_NAMES)
+
+
+def export_onnx(wrapper, example, output, opset):
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in INPUT_NAMES}
+    dynamic_axes["logits"] = {0: "batch", 1: "sequence"}
+    torch.onnx.export(
+        wrapper, example, output,
+        input_names=INPUT_NAMES,
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+        do_constant_folding=True
+    )
+
+
+def export_torchscript(wrapper, example, output):
+    with torch.no_grad():
+        traced = torch.jit.trace(wrapper, example, check_trace=False)
+    traced = torch.jit.freeze(traced)
+    traced.save(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=["onnx", "torchscript"], required=True)
+    parser.add_argument("--source", choices=["fp32", "int8"], default="fp32", help="eager model to export (int8 is TorchScript only)")
+    parser.add_argument("--output", help="output path, defaults to ONNX_MODEL_PATH / TORCHSCRIPT_MODEL_PATH")
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--output-vocab", choices=OUTPUT_VOCABS, default=BERT_OUTPUT_VOCAB, help="project onto every id or only the ids the tokenizer can decode")
+    parser.add_argument("--no-verify", action="store_true", help="skip comparing exported predictions with eager PyTorch")
+    args = parser.parse_args(argv)
+
+    if args.format == "onnx" and args.source == "int8":
+        parser.error("dynamic INT8 modules cannot be exported to ONNX, export fp32 and quantize with onnxruntime instead")
+
+    output = args.output or (ONNX_MODEL_PATH if args.format == "onnx" else TORCHSCRIPT_MODEL_PATH)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+
+    tokenizer = CorrectorTokenizer(tokenizer_path)
+    model = load_eager_model(args.source)
+    output_head = None
+    if args.output_vocab == "tokenizer":
+        output_head = load_output_head(model, tokenizer, args.source)
+        wrapper = _SubVocabLogits(model, output_head[1], output_head[2]).eval()
+    else:
+        wrapper = _LogitsOnly(model).eval()
+    batch, example = _example_inputs(tokenizer)
+
+    tmp_output = output + ".tmp"
+    if args.format == "onnx":
+        export_onnx(wrapper, example, tmp_output, args.opset)
+    else:
+        export_torchscript(wrapper, example, tmp_output)
+    os.replace(tmp_output, output)
+    print(f"Exported {args.source} corrector to {output} ({os.path.getsize(output) / 1e6:.1f} MB)")
+
+    ids_path = output_ids_path(output)
+    if output_head is not None:
+        with open(ids_path, "w") as f:
+            json.dump(output_head[0].tolist(), f)
+        print(f"Output head restricted to {len(output_head[0])} ids, listed in {ids_path}")
+    elif os.path.exists(ids_path):
+        os.remove(ids_path)
+
+    if not args.no_verify:
+        exported = OnnxRuntime(output) if args.format == "onnx" else TorchScriptRuntime(output)
+        expected = TorchRuntime(model, output_head).predict_ids(batch)
+        actual = exported.predict_ids(batch)
+        mask = batch['attention_mask'].astype(bool)
+        agreement = float(np.mean(expected[mask] == actual[mask]))
+        print(f"Token agreement with eager PyTorch on sample inputs: {agreement:.2%}")
+        if agreement < 0.99:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
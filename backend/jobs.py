@@ -0,0 +1,124 @@
+# jobs.py
+"""Background prediction jobs stored in MongoDB.
+
+POST /api/predict/jobs stores the upload as a queued job and returns at once;
+JobRunner threads claim queued jobs with an atomic find_one_and_update and
+process them. A claimed job holds a lease, so a job whose process died
+mid-prediction is picked up again once its lease expires, by this or any
+other web process sharing the collection, up to max_attempts times. The
+image is stored in the job document, so it must leave room under MongoDB's
+16 MB document limit (MAX_IMAGE_BYTES).
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import Binary
+from pymongo import ASCENDING, ReturnDocument
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+
+# MongoDB rejects documents over 16 MB; the rest of the job needs far less than 1 MB
+MAX_IMAGE_BYTES = 15 * 1024 * 1024
+
+
+class JobRunner:
+    def __init__(self, collection, handler, workers=1, lease_seconds=300, result_ttl_seconds=7 * 86400, poll_interval=1.0,
+                 max_attempts=3):
+        self.collection = collection
+        self.handler = handler
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.result_ttl_seconds = result_ttl_seconds
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._threads = []
+
+    def ensure_indexes(self):
+        self.collection.create_index([('status', ASCENDING), ('created_at', ASCENDING)])
+        self.collection.create_index([('user_id', ASCENDING), ('created_at', ASCENDING)])
+        # Finished jobs are removed by Mongo once expires_at has passed
+        self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def submit(self, user_id, image_data, filename=None):
+        """Queue a prediction and return the job id"""
+        if len(image_data) > MAX_IMAGE_BYTES:
+            raise ValueError(f"Image is larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB")
+        result = self.collection.insert_one({
+            'user_id': user_id,
+            'status': JOB_QUEUED,
+            'filename': filename,
+            'image': Binary(image_data),
+            'created_at': datetime.utcnow(),
+            'attempts': 0
+        })
+        self._wakeup.set()
+        return result.inserted_id
+
+    def _claim(self):
+        now = datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {'$or': [
+                {'status': JOB_QUEUED},
+                {'status': JOB_RUNNING, 'lease_expires_at': {'$lt': now}}
+            ]},
+            {
+                '$set': {
+                    'status': JOB_RUNNING,
+                    'started_at': now,
+                    'lease_expires_at': now + timedelta(seconds=self.lease_seconds)
+                },
+                '$inc': {'attempts': 1}
+            },
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _finish(self, job_id, fields):
+        finished_at = datetime.utcnow()
+        fields.update({
+            'finished_at': finished_at,
+            'expires_at': finished_at + timedelta(seconds=self.result_ttl_seconds)
+        })
+        # The image is only needed until the job is done
+        self.collection.update_one({'_id': job_id}, {'$set': fields, '$unset': {'image': '', 'lease_expires_at': ''}})
+
+    def _process(self, job):
+        if job['attempts'] > self.max_attempts:
+            # Every earlier attempt lost its lease, e.g. the image keeps killing the process
+            self._finish(job['_id'], {'status': JOB_FAILED, 'error': f"Gave up after {self.max_attempts} attempts"})
+            return
+        try:
+            result = self.handler(job)
+        except Exception as e:
+            self._finish(job['_id'], {'status': JOB_FAILED, 'error': str(e) or type(e).__name__})
+            return
+        self._finish(job['_id'], {'status': JOB_COMPLETED, 'result': result})
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception:
+                job = None
+                time.sleep(self.poll_interval)
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._process(job)
+
+    def start(self):
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"prediction-job-runner-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def queue_depth(self):
+        return self.collection.count_documents({'status': JOB_QUEUED})
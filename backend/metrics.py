@@ -0,0 +1,95 @@
+# metrics.py
+"""Prometheus metrics for the prediction pipeline, served at /metrics.
+
+Stage timings are measured where the stage runs (possibly in a worker
+process), returned with the prediction result under 'timings' and observed
+here in the web process, so the pool needs no metrics plumbing of its own.
+Under gunicorn set PROMETHEUS_MULTIPROC_DIR to aggregate all web workers.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# Sub-millisecond cache hits up to multi-second Tesseract runs
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = Histogram(
+    'prediction_stage_seconds', 'Time spent in each prediction pipeline stage',
+    ['stage'], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    'prediction_request_seconds', 'End-to-end prediction request latency',
+    ['endpoint'], buckets=LATENCY_BUCKETS
+)
+REQUESTS_TOTAL = Counter(
+    'prediction_requests_total', 'Prediction requests by outcome',
+    ['endpoint', 'outcome']
+)
+IN_FLIGHT = Gauge(
+    'prediction_requests_in_flight', 'Prediction requests currently being processed',
+    ['endpoint'], multiprocess_mode='livesum'
+)
+CACHE_LOOKUPS = Counter(
+    'prediction_cache_lookups_total', 'Result cache lookups',
+    ['result']
+)
+BERT_BATCH_SIZE = Histogram(
+    'bert_batch_size', 'Sequences per micro-batched BERT forward pass',
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+BERT_BATCH_WAIT_SECONDS = Histogram(
+    'bert_batch_wait_seconds', 'Time a correction waited in the micro-batch queue',
+    buckets=LATENCY_BUCKETS
+)
+BERT_BATCH_SECONDS = Histogram(
+    'bert_batch_seconds', 'Time to run one micro-batched BERT correction',
+    buckets=LATENCY_BUCKETS
+)
+BERT_QUEUE_DEPTH = Gauge(
+    'bert_queue_depth', 'Corrections waiting for the next micro-batch',
+    multiprocess_mode='livesum'
+)
+
+
+def observe_timings(timings):
+    for stage, seconds in timings.items():
+        STAGE_SECONDS.labels(stage=stage).observe(seconds)
+
+
+def observe_batch(batch_size, waits, process_seconds, queue_depth):
+    """MicroBatcher observer hook"""
+    BERT_BATCH_SIZE.observe(batch_size)
+    for wait in waits:
+        BERT_BATCH_WAIT_SECONDS.observe(wait)
+    BERT_BATCH_SECONDS.observe(process_seconds)
+    BERT_QUEUE_DEPTH.set(queue_depth)
+
+
+@contextmanager
+def track_request(endpoint):
+    """Count, time and track in-flight state of one request; set outcome via the yielded dict"""
+    state = {'outcome': 'success'}
+    IN_FLIGHT.labels(endpoint=endpoint).inc()
+    started = time.perf_counter()
+    try:
+        yield state
+    except Exception:
+        state['outcome'] = 'error'
+        raise
+    finally:
+        IN_FLIGHT.labels(endpoint=endpoint).dec()
+        REQUEST_SECONDS.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+        REQUESTS_TOTAL.labels(endpoint=endpoint, outcome=state['outcome']).inc()
+
+
+def render_metrics():
+    """Return (body, content_type) in Prometheus text format"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,306 @@
+# model_loader.py
+import os
+import threading
+import time
+from collections import namedtuple
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+# A distilled student (see distill.py) is served by pointing both at its output directory
+tokenizer_path = os.getenv("CORRECTOR_TOKENIZER_DIR", os.path.join(base_dir, "output_tokenizer"))
+checkpoint_path = os.getenv("CORRECTOR_CHECKPOINT", os.path.join(base_dir, "bert_ocr_model.pth"))
+cache_dir = os.getenv("MODEL_CACHE_DIR", os.path.join(base_dir, "model_cache"))
+
+# fp32: eager PyTorch as trained
+# int8: dynamic INT8 quantization of every nn.Linear, weights cached on disk
+# onnx: ONNX Runtime graph produced by export_model.py (no torch/transformers)
+# torchscript: TorchScript graph produced by export_model.py (no transformers)
+INFERENCE_BACKENDS = ("fp32", "int8", "onnx", "torchscript")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "fp32")
+QUANTIZED_CACHE = os.getenv("QUANTIZED_CACHE", "1") == "1"
+# Build the eager model without random initialization and memory-map its
+# weights from a safetensors copy of the checkpoint in MODEL_CACHE_DIR,
+# written on first load or by convert_checkpoint.py. Processes loading the
+# same file share its pages through the page cache.
+FAST_LOAD = os.getenv("FAST_LOAD", "1") == "1"
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", os.path.join(cache_dir, "bert_ocr_model.onnx"))
+TORCHSCRIPT_MODEL_PATH = os.getenv("TORCHSCRIPT_MODEL_PATH", os.path.join(cache_dir, "bert_ocr_model.torchscript.pt"))
+
+# full or tokenizer: restrict the MLM head to the ids the tokenizer can decode
+# (see output_vocab.py). Exported graphs pick theirs up at export time.
+BERT_OUTPUT_VOCAB = os.getenv("BERT_OUTPUT_VOCAB", "full")
+
+LoadedModel = namedtuple("LoadedModel", ["tokenizer", "runtime", "backend"])
+
+
+def model_version():
+    """Short tag of the corrector checkpoint, so results are cached per model"""
+    try:
+        stat = os.stat(checkpoint_path)
+    except OSError:
+        return "none"
+    tag = f"{int(stat.st_mtime)}.{stat.st_size}"
+    return tag if BERT_OUTPUT_VOCAB == "full" else f"{tag}.{BERT_OUTPUT_VOCAB}"
+
+
+def _quantized_cache_path():
+    # Keyed on the source checkpoint so a retrained model never reuses stale weights
+    stat = os.stat(checkpoint_path)
+    return os.path.join(cache_dir, f"bert_ocr_model.int8.{int(stat.st_mtime)}.{stat.st_size}.pt")
+
+
+def safetensors_cache_path():
+    stat = os.stat(checkpoint_path)
+    return os.path.join(cache_dir, f"bert_ocr_model.{int(stat.st_mtime)}.{stat.st_size}.safetensors")
+
+
+def write_safetensors(path):
+    """Copy the checkpoint to a safetensors file; tied tensors are stored once"""
+    import torch
+    from safetensors.torch import save_file
+
+    state = torch.load(checkpoint_path, map_location="cpu")
+    tensors = {}
+    seen = set()
+    for name, tensor in state.items():
+        view = (tensor.untyped_storage().data_ptr(), tensor.storage_offset(), tuple(tensor.shape))
+        if view in seen:
+            continue
+        seen.add(view)
+        tensors[name] = tensor.contiguous()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    save_file(tensors, tmp_path, metadata={'format': 'pt', 'source': os.path.basename(checkpoint_path)})
+    os.replace(tmp_path, path)
+    return path
+
+
+def _set_parameter(model, name, parameter):
+    module_name, _, attribute = name.rpartition(".")
+    setattr(model.get_submodule(module_name), attribute, parameter)
+
+
+def _fill_buffers(model, selected):
+    """Set the selected non-persistent buffers, which are not in the checkpoint, to their constant values"""
+    import torch
+
+    for name, buffer in list(model.named_buffers()):
+        if selected(buffer) and name.endswith("position_ids"):
+            _set_parameter(model, name, torch.arange(buffer.shape[-1]).expand(buffer.shape).contiguous())
+        elif selected(buffer) and name.endswith("token_type_ids"):
+            _set_parameter(model, name, torch.zeros(buffer.shape, dtype=buffer.dtype))
+
+
+def _quantized_skeleton(config):
+    """Dynamically quantized BertForMaskedLM with zero weights, for a cached INT8 state dict to be loaded into"""
+    import torch
+    from transformers import BertForMaskedLM
+
+    # Neither the checkpoint nor any initializer is touched
+    with torch.device("meta"):
+        model = BertForMaskedLM(config)
+    model = model.to_empty(device="cpu")
+    with torch.no_grad():
+        for parameter in model.parameters():
+            parameter.zero_()
+    _fill_buffers(model, lambda buffer: True)
+    return _quantize(model.eval())
+
+
+def _load_fast(config):
+    """FP32 model built on the meta device, its parameters assigned from the memory-mapped safetensors file"""
+    import torch
+    from safetensors.torch import load_file
+    from transformers import BertForMaskedLM
+
+    path = safetensors_cache_path()
+    if not os.path.exists(path):
+        write_safetensors(path)
+
+    # No memory is allocated and no initializer runs on the meta device
+    with torch.device("meta"):
+        model = BertForMaskedLM(config)
+    tied = {}
+    for name, parameter in model.named_parameters(remove_duplicate=False):
+        tied.setdefault(id(parameter), []).append(name)
+
+    result = model.load_state_dict(load_file(path), strict=False, assign=True)
+    if result.unexpected_keys:
+        raise RuntimeError(f"Unexpected keys in {path}: {', '.join(result.unexpected_keys)}")
+
+    # assign=True replaces parameters one name at a time, which unties
+    # shared ones (the decoder and the word embeddings); tie them again
+    for names in tied.values():
+        loaded = next((model.get_parameter(name) for name in names if not model.get_parameter(name).is_meta), None)
+        if loaded is not None:
+            for name in names:
+                _set_parameter(model, name, loaded)
+
+    _fill_buffers(model, lambda buffer: buffer.is_meta)
+
+    missing = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers()) if tensor.is_meta]
+    if missing:
+        raise RuntimeError(f"Missing weights in {path}: {', '.join(missing)}")
+    return model
+
+
+def _load_fp32(config):
+    import torch
+    from transformers import BertForMaskedLM
+
+    if FAST_LOAD:
+        return _load_fast(config)
+    model = BertForMaskedLM(config)
+    model.load_state_dict(torch.load(checkpoint_path, map_location="cpu"))
+    return model
+
+
+def _quantize(model):
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _load_int8(config):
+    import torch
+
+    cache_path = _quantized_cache_path()
+    if QUANTIZED_CACHE and os.path.exists(cache_path):
+        # Rebuild the quantized module structure, then load the cached INT8
+        # weights instead of reading and re-quantizing the FP32 checkpoint
+        model = _quantized_skeleton(config)
+        model.load_state_dict(torch.load(cache_path, map_location="cpu"))
+        return model
+
+    model = _quantize(_load_fp32(config).eval())
+    if QUANTIZED_CACHE:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        torch.save(model.state_dict(), tmp_path)
+        os.replace(tmp_path, cache_path)
+    return model
+
+
+def load_eager_model(backend="fp32"):
+    """Build the eager BertForMaskedLM for the fp32 or int8 backend"""
+    from transformers import BertConfig
+
+    config = BertConfig.from_pretrained(tokenizer_path)
+    if backend == "int8":
+        model = _load_int8(config)
+    else:
+        model = _load_fp32(config)
+    return model.eval()
+
+
+def load_output_head(model, tokenizer, backend="fp32"):
+    """(ids, weight, bias) of the tokenizer sub-vocabulary head, sliced once and cached"""
+    from output_vocab import tokenizer_output_ids, load_sliced_decoder, ids_digest
+
+    ids = tokenizer_output_ids(tokenizer, model.config.vocab_size)
+    cache_path = os.path.join(cache_dir, f"decoder.{backend}.{model_version()}.{ids_digest(ids)}.pt")
+    weight, bias = load_sliced_decoder(model, ids, cache_path)
+    return ids, weight, bias
+
+
+def load_corrector(backend=None):
+    """Load the tokenizer and corrector runtime for the given backend.
+
+    torch and transformers are imported lazily, and only by the backends that
+    need them, so that importing the web app does not pay for them.
+    """
+    from cpu_topology import configure
+    from runtimes import CorrectorTokenizer, TorchRuntime, OnnxRuntime, TorchScriptRuntime
+
+    from output_vocab import OUTPUT_VOCABS
+
+    backend = backend or INFERENCE_BACKEND
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {', '.join(INFERENCE_BACKENDS)}")
+    if BERT_OUTPUT_VOCAB not in OUTPUT_VOCABS:
+        raise ValueError(f"Unknown BERT_OUTPUT_VOCAB '{BERT_OUTPUT_VOCAB}', expected one of {', '.join(OUTPUT_VOCABS)}")
+
+    # This process's share of the cores, unless a pool worker already set it
+    topology = configure(use_torch=backend != "onnx")
+    tokenizer = CorrectorTokenizer(tokenizer_path)
+    if backend == "onnx":
+        runtime = OnnxRuntime(ONNX_MODEL_PATH, topology['threads'], topology['interop_threads'])
+    elif backend == "torchscript":
+        runtime = TorchScriptRuntime(TORCHSCRIPT_MODEL_PATH)
+    else:
+        model = load_eager_model(backend)
+        output_head = load_output_head(model, tokenizer, backend) if BERT_OUTPUT_VOCAB == "tokenizer" else None
+        runtime = TorchRuntime(model, output_head)
+    return LoadedModel(tokenizer, runtime, backend)
+
+
+class ModelHandle:
+    """Loads a model on first use or in a background thread, exactly once.
+
+    get() blocks until the model is loaded. If loading failed, get() raises
+    and the next call retries the load.
+    """
+
+    def __init__(self, loader, name="model"):
+        self.loader = loader
+        self.name = name
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._value = None
+        self._state = "not_loaded"
+        self._error = None
+        self._load_started_at = None
+        self._load_time = None
+        self._thread = None
+
+    def _load(self):
+        with self._lock:
+            if self._ready.is_set():
+                return
+            self._state = "loading"
+            self._error = None
+            self._load_started_at = time.time()
+            started = time.perf_counter()
+            try:
+                self._value = self.loader()
+            except Exception as e:
+                self._state = "failed"
+                self._error = str(e)
+                raise
+            self._load_time = time.perf_counter() - started
+            self._state = "ready"
+            self._ready.set()
+
+    def _load_in_background(self):
+        try:
+            self._load()
+        except Exception:
+            # The error is kept in status(); get() will retry
+            pass
+
+    def start_background(self):
+        """Start loading in a daemon thread and return immediately"""
+        if self._ready.is_set() or self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._load_in_background, name=f"{self.name}-loader", daemon=True)
+        self._thread.start()
+
+    def get(self):
+        if not self._ready.is_set():
+            self._load()
+        return self._value
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def status(self):
+        return {
+            'name': self.name,
+            'state': self._state,
+            'ready': self._ready.is_set(),
+            'load_started_at': self._load_started_at,
+            'load_time_seconds': self._load_time,
+            'error': self._error
+        }
+
+
+corrector_handle = ModelHandle(load_corrector, name="bert-corrector")
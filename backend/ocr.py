@@ -0,0 +1,203 @@
+# ocr.py
+"""OCR engines used by the predictor.
+
+pytesseract writes every image to a temp file and spawns a `tesseract`
+process that reloads the language data on each call. The tesserocr engine
+keeps one initialised libtesseract handle per thread (a worker process
+runs one request at a time, so effectively one per worker) and hands it
+the NumPy buffer directly. tesserocr is optional, see requirements.txt
+for how to install it; without it the pytesseract engine is used.
+
+Every engine takes a 2-D uint8 array and returns the recognised words in
+reading order, each a dict with its text, Tesseract confidence (0-100),
+box [left, top, width, height] and the block and line it belongs to.
+read_pages OCRs the text regions of several pages as separate tiles,
+optionally in parallel, and merges their words back in reading order.
+"""
+import os
+import threading
+
+import numpy as np
+
+OCR_BACKENDS = ("auto", "tesserocr", "pytesseract")
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Directory holding the .traineddata files, default is tesseract's own
+OCR_TESSDATA = os.getenv("OCR_TESSDATA") or None
+# White border added around each tile, Tesseract misreads text touching the edge
+TILE_BORDER = 10
+
+
+class PytesseractEngine:
+    """One `tesseract` subprocess per call"""
+
+    name = "pytesseract"
+
+    def __init__(self, lang=OCR_LANG, tessdata=OCR_TESSDATA):
+        import pytesseract
+
+        self._pytesseract = pytesseract
+        self.lang = lang
+        self.config = f'--tessdata-dir "{tessdata}"' if tessdata else ""
+
+    def image_to_data(self, img):
+        data = self._pytesseract.image_to_data(img, lang=self.lang, config=self.config, output_type=self._pytesseract.Output.DICT)
+        words = []
+        lines = {}
+        for i, text in enumerate(data['text']):
+            text = (text or "").strip()
+            conf = float(data['conf'][i])
+            # Page/block/line rows carry conf -1 and no text
+            if not text or conf < 0:
+                continue
+            line_key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            words.append({
+                'text': text,
+                'confidence': round(conf, 2),
+                'box': [int(data['left'][i]), int(data['top'][i]), int(data['width'][i]), int(data['height'][i])],
+                'block': int(data['block_num'][i]),
+                'line': lines.setdefault(line_key, len(lines))
+            })
+        return words
+
+
+class TesserocrEngine:
+    """Long-lived libtesseract API handles, one per thread (they are not thread-safe)"""
+
+    name = "tesserocr"
+
+    def __init__(self, lang=OCR_LANG, tessdata=OCR_TESSDATA):
+        import tesserocr
+
+        self._tesserocr = tesserocr
+        self.lang = lang
+        self.tessdata = tessdata
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            kwargs = {'lang': self.lang}
+            if self.tessdata:
+                kwargs['path'] = self.tessdata
+            api = self._tesserocr.PyTessBaseAPI(**kwargs)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def image_to_data(self, img):
+        RIL = self._tesserocr.RIL
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        height, width = img.shape[:2]
+        api = self._api()
+        words = []
+        try:
+            api.SetImageBytes(img.tobytes(), width, height, 1, width)
+            api.Recognize()
+            iterator = api.GetIterator()
+            if iterator is None:
+                return words
+            block = line = -1
+            for word in self._tesserocr.iterate_level(iterator, RIL.WORD):
+                if word.IsAtBeginningOf(RIL.BLOCK):
+                    block += 1
+                if word.IsAtBeginningOf(RIL.TEXTLINE):
+                    line += 1
+                text = (word.GetUTF8Text(RIL.WORD) or "").strip()
+                box = word.BoundingBox(RIL.WORD)
+                if not text or box is None:
+                    continue
+                left, top, right, bottom = box
+                words.append({
+                    'text': text,
+                    'confidence': round(float(word.Confidence(RIL.WORD)), 2),
+                    'box': [left, top, right - left, bottom - top],
+                    'block': max(block, 0),
+                    'line': max(line, 0)
+                })
+            return words
+        finally:
+            # Drop the image and recognition results, keep the loaded language data
+            api.Clear()
+
+    def close(self):
+        with self._lock:
+            apis, self._apis = self._apis, []
+        for api in apis:
+            api.End()
+
+
+def _read_tile(engine, img, region):
+    x, y, w, h = region
+    tile = np.pad(img[y:y + h, x:x + w], TILE_BORDER, mode="constant", constant_values=255)
+    return engine.image_to_data(tile)
+
+
+def read_pages(engine, pages, regions, executor=None):
+    """OCR regions[i] of every pages[i] as separate tiles and merge the words in reading order.
+
+    Tiles run on executor when given. Boxes are mapped back to page
+    coordinates, words get their 'page' index, and block and line ids are
+    renumbered so they stay unique across tiles and pages.
+    """
+    tasks = [(page, region) for page, page_regions in enumerate(regions) for region in page_regions]
+    if executor is not None and len(tasks) > 1:
+        results = list(executor.map(lambda task: _read_tile(engine, pages[task[0]], task[1]), tasks))
+    else:
+        results = [_read_tile(engine, pages[page], region) for page, region in tasks]
+
+    words = []
+    blocks = lines = 0
+    for (page, (x, y, _, _)), tile_words in zip(tasks, results):
+        if not tile_words:
+            continue
+        for word in tile_words:
+            left, top, width, height = word['box']
+            word['box'] = [left + x - TILE_BORDER, top + y - TILE_BORDER, width, height]
+            word['page'] = page
+            word['block'] += blocks
+            word['line'] += lines
+            words.append(word)
+        blocks = max(word['block'] for word in tile_words) + 1
+        lines = max(word['line'] for word in tile_words) + 1
+    return words
+
+
+def words_to_text(words):
+    """Rebuild plain text from words: spaces within a line, newlines between lines, blank lines between blocks"""
+    parts = []
+    previous = None
+    for word in words:
+        if previous is not None:
+            if word['block'] != previous['block']:
+                parts.append("\n\n")
+            elif word['line'] != previous['line']:
+                parts.append("\n")
+            else:
+                parts.append(" ")
+        parts.append(word['text'])
+        previous = word
+    return "".join(parts)
+
+
+def mean_confidence(words):
+    if not words:
+        return 0.0
+    return round(sum(word['confidence'] for word in words) / len(words), 2)
+
+
+def create_engine(backend=None):
+    """Build the configured OCR engine; 'auto' prefers tesserocr when it is installed"""
+    backend = backend or OCR_BACKEND
+    if backend not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR_BACKEND {backend!r}, expected one of {', '.join(OCR_BACKENDS)}")
+    if backend in ("auto", "tesserocr"):
+        try:
+            return TesserocrEngine()
+        except ImportError:
+            if backend == "tesserocr":
+                raise
+    return PytesseractEngine()
@@ -0,0 +1,68 @@
+# output_vocab.py
+"""Sub-vocabulary output head for the BERT corrector.
+
+BertForMaskedLM projects every hidden state onto all 30522 ids of its
+config, although the corrector's tokenizer can only ever decode the ids
+below its own vocab_size. With BERT_OUTPUT_VOCAB=tokenizer the decoder is
+cut down to exactly those ids, special tokens and [UNK] included, so a
+position the full head maps to [UNK] still decodes to "" and corrections
+match the full head's. They can only differ where the full head's best id
+is one the tokenizer cannot produce (it decodes to "" too), which a model
+fine-tuned with this tokenizer does not predict. For the character-level
+tokenizer this keeps 62 of 30522 rows, which makes the largest matmul of
+the forward pass and the logits tensor a fraction of their size; nothing
+is pruned for a tokenizer whose vocabulary is the model's. The sliced
+decoder weights are cached in MODEL_CACHE_DIR.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+# full: project onto every id the model knows
+# tokenizer: only the ids the corrector's tokenizer can decode
+OUTPUT_VOCABS = ("full", "tokenizer")
+
+
+def tokenizer_output_ids(tokenizer, model_vocab_size):
+    """Ids of the tokenizer head: every id below the tokenizer's vocab_size"""
+    if tokenizer.vocab_size > model_vocab_size:
+        raise ValueError(
+            f"The corrector tokenizer has {tokenizer.vocab_size} ids but the model only {model_vocab_size}, "
+            "they do not belong together"
+        )
+    return np.arange(tokenizer.vocab_size, dtype=np.int64)
+
+
+def slice_decoder(model, ids):
+    """FP32 (weight, bias) rows of the MLM decoder for ids; works on dynamically quantized models too"""
+    import torch
+
+    decoder = model.cls.predictions.decoder
+    weight = decoder.weight() if callable(decoder.weight) else decoder.weight
+    bias = decoder.bias() if callable(decoder.bias) else decoder.bias
+    if weight.is_quantized:
+        weight = weight.dequantize()
+    index = torch.from_numpy(ids)
+    return weight.detach()[index].float().contiguous(), bias.detach()[index].float().contiguous()
+
+
+def load_sliced_decoder(model, ids, cache_path):
+    """slice_decoder, cached at cache_path as {'ids', 'weight', 'bias'}"""
+    import torch
+
+    if os.path.exists(cache_path):
+        cached = torch.load(cache_path, map_location="cpu")
+        if np.array_equal(cached['ids'].numpy(), ids):
+            return cached['weight'], cached['bias']
+
+    weight, bias = slice_decoder(model, ids)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    torch.save({'ids': torch.from_numpy(ids), 'weight': weight, 'bias': bias}, tmp_path)
+    os.replace(tmp_path, cache_path)
+    return weight, bias
+
+
+def ids_digest(ids):
+    return hashlib.sha256(np.ascontiguousarray(ids, dtype=np.int64).tobytes()).hexdigest()[:12]
@@ -1,79 +1,451 @@
 # predictor.py
-import torch
-from transformers import BertForMaskedLM, BertTokenizerFast, BertConfig
-from PIL import Image
-import numpy as np
-import cv2
-import pytesseract
-from difflib import get_close_matches, SequenceMatcher
 import os
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from batching import MicroBatcher
+from cpu_topology import threads_per_replica
+from metrics import observe_batch
+from model_loader import corrector_handle, model_version, INFERENCE_BACKEND
+from drug_dictionary import FormularyStore
+from preprocessing import load_image, load_pages, binarize, find_text_regions
+from ocr import create_engine, read_pages, words_to_text, mean_confidence
 
-# Load model + tokenizer once
 base_dir = os.path.dirname(os.path.abspath(__file__))
-tokenizer_path = os.path.join(base_dir, "output_tokenizer")
 
-tokenizer = BertTokenizerFast.from_pretrained(tokenizer_path)
-config = BertConfig.from_pretrained(tokenizer_path)
-model = BertForMaskedLM(config)
-model.load_state_dict(torch.load("bert_ocr_model.pth", map_location="cpu"))
-model.eval()
+# Load drug formulary (drug_list.txt, a TSV formulary or a prebuilt .fidx index).
+# With FORMULARY_RELOAD_INTERVAL > 0 the file is polled and reloaded in place.
+# Requests also check its mtime at most every FORMULARY_CHECK_INTERVAL
+# seconds, so a reload reaches every web and pool worker process.
+FORMULARY_PATH = os.getenv("FORMULARY_PATH", os.path.join(base_dir, "drug_list.txt"))
+FORMULARY_RELOAD_INTERVAL = float(os.getenv("FORMULARY_RELOAD_INTERVAL", "0"))
+FORMULARY_CHECK_INTERVAL = float(os.getenv("FORMULARY_CHECK_INTERVAL", "1"))
+formulary = FormularyStore(FORMULARY_PATH, cutoff=0.75, check_interval=FORMULARY_CHECK_INTERVAL)
+if FORMULARY_RELOAD_INTERVAL > 0:
+    formulary.start_watcher(FORMULARY_RELOAD_INTERVAL)
+
+# OCR_BACKEND selects tesserocr (persistent in-process handle) or pytesseract
+ocr_engine = create_engine()
+
+# Text regions and pages are OCRed as separate tiles on this many threads
+# (0 = this replica's share of the cores, see cpu_topology.py).
+# OCR_TILING=0 OCRs each page in one call.
+OCR_THREADS = int(os.getenv("OCR_THREADS", "0"))
+if OCR_THREADS <= 0:
+    OCR_THREADS = threads_per_replica()
+OCR_TILING = os.getenv("OCR_TILING", "1") == "1"
+ocr_executor = ThreadPoolExecutor(OCR_THREADS, thread_name_prefix="ocr") if OCR_THREADS > 1 else None
+
+def restart_threads():
+    """Recreate this module's threads in a forked worker, which inherits the module but none of its threads"""
+    global OCR_THREADS, ocr_executor
+    OCR_THREADS = int(os.getenv("OCR_THREADS", "0")) or threads_per_replica()
+    ocr_executor = ThreadPoolExecutor(OCR_THREADS, thread_name_prefix="ocr") if OCR_THREADS > 1 else None
+    if FORMULARY_RELOAD_INTERVAL > 0:
+        formulary.restart_watcher(FORMULARY_RELOAD_INTERVAL)
+
+def ocr_pages(pages, timings=None):
+    """Recognised words of preprocessed pages, with boxes and confidences (see ocr.py)"""
+    with timed(timings, 'layout'):
+        if OCR_TILING:
+            regions = [find_text_regions(page) for page in pages]
+        else:
+            regions = [[(0, 0, page.shape[1], page.shape[0])] for page in pages]
+    with timed(timings, 'ocr'):
+        return read_pages(ocr_engine, pages, regions, ocr_executor)
+
+def ocr_image(img):
+    return ocr_pages([img])
+
+def _public_words(words):
+    return [{'text': word['text'], 'confidence': word['confidence'], 'box': word['box'], 'page': word['page']} for word in words]
+
+# Words Tesseract is at least this confident about (0-100) are trusted as
+# read and never sent to BERT. Every word is still fuzzy-matched.
+OCR_CONFIDENCE_THRESHOLD = float(os.getenv("OCR_CONFIDENCE_THRESHOLD", "85"))
+
+# Bump when preprocessing, OCR or matching changes results, so cached
+# predictions from an older pipeline are not served
+PIPELINE_VERSION = "8"
+
+def pipeline_version(formulary_mtime=None):
+    """Tag identifying everything that determines a prediction for given image bytes.
 
-# Load drug list
-with open("drug_list.txt") as f:
-    drug_list = [line.strip().lower() for line in f]
+    Results carry the tag of the formulary they were matched with, which
+    can be newer or older than this process's.
+    """
+    if formulary_mtime is None:
+        formulary_mtime = formulary.current().mtime
+    return f"{PIPELINE_VERSION}/{ocr_engine.name}/{INFERENCE_BACKEND}.{model_version()}/{formulary_mtime:.0f}"
+
+# Max number of sequences per BERT forward pass when correcting a batch, and
+# max padded tokens (sequences x longest sequence) per pass, so batches of
+# long windows get fewer rows than batches of short lines
+BERT_BATCH_SIZE = int(os.getenv("BERT_BATCH_SIZE", "8"))
+BERT_MAX_LENGTH = int(os.getenv("BERT_MAX_LENGTH", "128"))
+BERT_BATCH_TOKENS = int(os.getenv("BERT_BATCH_TOKENS", str(BERT_BATCH_SIZE * BERT_MAX_LENGTH)))
+# Sequences longer than BERT_MAX_LENGTH are corrected in windows that share
+# this many tokens of context with their neighbours
+BERT_WINDOW_OVERLAP = int(os.getenv("BERT_WINDOW_OVERLAP", "32"))
+# At most this many tokens go through BERT per image; lines holding the
+# least confident words are corrected first
+BERT_TOKEN_BUDGET = int(os.getenv("BERT_TOKEN_BUDGET", "512"))
+# BERT is skipped when every formulary match scored at least this (0-100)
+BERT_SKIP_CONFIDENCE = float(os.getenv("BERT_SKIP_CONFIDENCE", "90"))
+
+# Concurrent single-image requests are collected for up to this many
+# milliseconds into one BERT forward pass. 0 disables micro-batching.
+BERT_BATCH_WINDOW_MS = float(os.getenv("BERT_BATCH_WINDOW_MS", "10"))
+
+@contextmanager
+def timed(timings, stage):
+    """Add the wall time of the block to timings[stage] (seconds), if timings is a dict"""
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
 
 def preprocess_image(image_bytes):
-    image = Image.open(image_bytes).convert("RGB")
-    img = np.array(image)
-    if len(img.shape) == 3:
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    img = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-    _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    return img
+    return binarize(load_image(image_bytes))
 
-def extract_text_and_predict(image_bytes):
-    preprocessed = preprocess_image(image_bytes)
-    ocr_text = pytesseract.image_to_string(preprocessed).strip()
+def _is_candidate(word):
+    return word.isalpha() and len(word) > 2
 
-    if not ocr_text:
-        return "[No OCR found]", "[Skipped]", [], 0.0, 0.0
+def _match_word(current, word):
+    """(canonical_name, score) of the formulary entry matching word, or None"""
+    word = word.lower()
+    resolved = current.dictionary.resolve(word)
+    if resolved is not None:
+        return resolved[1], 100.0
+    match = current.matcher.best_match(word)
+    if match:
+        drug_name, similarity = match
+        return current.dictionary.resolve(drug_name)[1], similarity * 100
+    return None
+
+def _numbers(phrase):
+    return [word for word in phrase.split() if any(c.isdigit() for c in word)]
+
+def _match_phrase(current, words):
+    """(canonical_name, score) of the formulary entry matching consecutive words, or None.
+
+    A phrase only fuzzy-matches entries of as many words and with the same
+    numbers, so "amoxicillin 250 mg" never matches "amoxicillin 500 mg" and
+    "amoxicillin bid" is left to match "amoxicillin" alone.
+    """
+    if not _is_candidate(words[0]):
+        return None
+    if len(words) == 1:
+        return _match_word(current, words[0])
+    phrase = " ".join(words).lower()
+    resolved = current.dictionary.resolve(phrase)
+    if resolved is not None:
+        return resolved[1], 100.0
+    match = current.matcher.best_match(phrase)
+    if match and len(match[0].split()) == len(words) and _numbers(match[0]) == _numbers(phrase):
+        drug_name, similarity = match
+        return current.dictionary.resolve(drug_name)[1], similarity * 100
+    return None
+
+def _match_words(current, words):
+    """Formulary matches in a run of words, trying the longest phrase first at each word.
+
+    Phrases are up to the formulary's longest name in words. Yields
+    (start, end, (canonical_name, score)) for each match of words[start:end].
+    """
+    start = 0
+    while start < len(words):
+        for end in range(min(start + current.dictionary.max_words, len(words)), start, -1):
+            match = _match_phrase(current, words[start:end])
+            if match:
+                yield start, end, match
+                start = end
+                break
+        else:
+            start += 1
+
+def match_drugs(text, found, drug_confidence_scores, current=None):
+    """Fuzzy-match the words of text against the formulary, updating found and scores in place.
+
+    Matched synonyms are reported under their canonical drug name.
+    """
+    current = current or formulary.current()
+    for _, _, match in _match_words(current, text.split()):
+        found.add(match[0])
+        drug_confidence_scores.append(match[1])
+
+def _length_batches(lengths):
+    """Indices grouped into forward passes, shortest sequences first.
+
+    Sorting by length keeps padding to a minimum; a batch closes at
+    BERT_BATCH_SIZE sequences or when padding every row to its longest
+    sequence would exceed BERT_BATCH_TOKENS.
+    """
+    batches, batch = [], []
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        if batch and (len(batch) >= BERT_BATCH_SIZE or (len(batch) + 1) * lengths[i] > BERT_BATCH_TOKENS):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+def _window_starts(body_length):
+    """Offsets into the tokens between [CLS] and [SEP] of the overlapping windows covering them"""
+    size = BERT_MAX_LENGTH - 2
+    if body_length <= size:
+        return [0]
+    step = max(1, size - BERT_WINDOW_OVERLAP)
+    starts = list(range(0, body_length - size, step))
+    # The last window ends with the sequence rather than running past it
+    starts.append(body_length - size)
+    return starts
+
+def _split_windows(ids, positions, cls_token_id, sep_token_id):
+    """Split one [CLS] ... [SEP] sequence into windows of at most BERT_MAX_LENGTH tokens.
+
+    Each position is predicted in the window where it has the most context
+    on both sides. Returns (window_ids, window_positions, indices) per
+    window that has positions, indices pointing into positions.
+    """
+    if len(ids) <= BERT_MAX_LENGTH:
+        return [(ids, list(positions), list(range(len(positions))))]
+
+    body = ids[1:-1]
+    size = BERT_MAX_LENGTH - 2
+    starts = _window_starts(len(body))
+    windows = [([cls_token_id] + list(body[start:start + size]) + [sep_token_id], [], []) for start in starts]
+    for index, column in enumerate(positions):
+        if column <= 0:
+            owner, window_column = 0, column
+        elif column >= len(ids) - 1:
+            owner, window_column = len(starts) - 1, len(windows[-1][0]) - 1
+        else:
+            token = column - 1
+            owner = max(
+                (k for k, start in enumerate(starts) if start <= token < start + size),
+                key=lambda k: min(token - starts[k], starts[k] + size - 1 - token)
+            )
+            window_column = token - starts[owner] + 1
+        windows[owner][1].append(window_column)
+        windows[owner][2].append(index)
+    return [window for window in windows if window[1]]
+
+def correct_sequences(sequences, timings=None):
+    """Run BERT over (input_ids, positions) pairs, predicting only at the given positions.
+
+    The encoder sees the whole sequence as context, but the MLM head (the
+    vocabulary projection) runs only where a prediction is wanted. Returns
+    the predicted ids per sequence, one per position. Sequences longer than
+    BERT_MAX_LENGTH tokens are corrected in overlapping windows (see
+    _split_windows) and run in length-sorted micro-batches (see
+    _length_batches).
+    """
+    if not sequences:
+        return []
+
+    loaded = corrector_handle.get()
+    tokenizer, runtime = loaded.tokenizer, loaded.runtime
+    windows, owners = [], []
+    for i, (ids, positions) in enumerate(sequences):
+        if positions:
+            for window in _split_windows(ids, positions, tokenizer.cls_token_id, tokenizer.sep_token_id):
+                windows.append(window)
+                owners.append(i)
+    predicted = [np.zeros(len(positions), dtype=np.int64) for _, positions in sequences]
+
+    for chunk in _length_batches([len(window[0]) for window in windows]):
+        rows = np.concatenate([np.full(len(windows[w][1]), row, dtype=np.int64) for row, w in enumerate(chunk)])
+        cols = np.concatenate([np.asarray(windows[w][1], dtype=np.int64) for w in chunk])
+        with timed(timings, 'bert_forward'):
+            ids = runtime.predict_positions(tokenizer.pad([windows[w][0] for w in chunk]), rows, cols)
+        offset = 0
+        for w in chunk:
+            indices = windows[w][2]
+            predicted[owners[w]][indices] = ids[offset:offset + len(indices)]
+            offset += len(indices)
+
+    return predicted
+
+def _correct_groups(groups):
+    """MicroBatcher callback: each queued item is the list of sequences of one request"""
+    predicted = correct_sequences([sequence for group in groups for sequence in group])
+    results = []
+    for group in groups:
+        results.append(predicted[:len(group)])
+        predicted = predicted[len(group):]
+    return results
+
+correction_batcher = None
+if BERT_BATCH_WINDOW_MS > 0:
+    correction_batcher = MicroBatcher(_correct_groups, max_batch_size=BERT_BATCH_SIZE, max_wait_ms=BERT_BATCH_WINDOW_MS, name="bert-batcher", observer=observe_batch)
+
+def correct_masked(sequences, timings=None):
+    """correct_sequences for one request, sharing a forward pass with concurrent callers when batching is on.
+
+    Forward timings are only broken out when the call is not micro-batched,
+    since a batch is shared between requests.
+    """
+    if not sequences:
+        return []
+    if correction_batcher is None:
+        return correct_sequences(sequences, timings)
+    return correction_batcher.submit(list(sequences))
+
+def batching_stats():
+    if correction_batcher is None:
+        return {'enabled': False}
+    stats = correction_batcher.stats()
+    stats['enabled'] = True
+    return stats
+
+def _preprocess_pages(pages, infos=None):
+    """Binarize every page, concurrently for multi-page uploads"""
+    infos = infos if infos is not None else [{} for _ in pages]
+    if ocr_executor is not None and len(pages) > 1:
+        return list(ocr_executor.map(binarize, pages, infos))
+    return [binarize(page, info) for page, info in zip(pages, infos)]
+
+def _ocr_stage(image_bytes, timings=None):
+    with timed(timings, 'decode'):
+        pages = load_pages(image_bytes)
+    with timed(timings, 'preprocess'):
+        preprocessed = _preprocess_pages(pages)
+    words = ocr_pages(preprocessed, timings)
+    with timed(timings, 'match'):
+        return _match_stage(words)
 
-    # Calculate OCR confidence based on text length and quality
-    ocr_confidence = min(100.0, max(0.0, len(ocr_text) * 2.0))  # Basic confidence based on text length
-    
-    words = [w for w in ocr_text.split() if w.isalpha() and len(w) > 2]
+def _match_stage(words):
+    """Match OCR words against the formulary and pick the ones worth correcting.
+
+    Every candidate word is fuzzy-matched, so ordinary misspellings that
+    Tesseract reads confidently still find their drug. Low-confidence words
+    that match nothing are the 'suspicious' words BERT corrects. BERT is skipped when there are none,
+    or when every drug found matched with at least BERT_SKIP_CONFIDENCE.
+    """
+    current = formulary.current()
     found = set()
     drug_confidence_scores = []
+    lines = {}
+    for index, word in enumerate(words):
+        lines.setdefault(word['line'], []).append(index)
+    # Multi-word names ("amoxicillin 500 mg") are matched within a line
+    matched = set()
+    for indices in lines.values():
+        for start, end, match in _match_words(current, [words[index]['text'] for index in indices]):
+            found.add(match[0])
+            drug_confidence_scores.append(match[1])
+            matched.update(indices[start:end])
 
-    for word in words:
-        matches = get_close_matches(word.lower(), drug_list, n=1, cutoff=0.75)
-        if matches:
-            found.add(matches[0])
-            # Calculate confidence based on similarity using SequenceMatcher
-            similarity = SequenceMatcher(None, word.lower(), matches[0]).ratio()
-            confidence = similarity * 100
-            drug_confidence_scores.append(confidence)
+    suspicious = []
+    for index, word in enumerate(words):
+        text = word['text']
+        confident = word['confidence'] >= OCR_CONFIDENCE_THRESHOLD
+        # Includes misreads such as "paracetam0l" that can never match as read
+        if index not in matched and not confident and len(text) > 2 and any(c.isalpha() for c in text):
+            suspicious.append(index)
 
-    predicted_text = ""
-    if not found or len(ocr_text) < 20:
-        try:
-            inputs = tokenizer(ocr_text, return_tensors="pt", padding=True, truncation=True, max_length=128)
-            with torch.no_grad():
-                outputs = model(**inputs)
-                predictions = torch.argmax(outputs.logits, dim=-1)
-                predicted_text = tokenizer.decode(predictions[0], skip_special_tokens=True)
-
-            corrected_words = [w for w in predicted_text.split() if w.isalpha() and len(w) > 2]
-            for word in corrected_words:
-                matches = get_close_matches(word.lower(), drug_list, n=1, cutoff=0.75)
-                if matches:
-                    found.add(matches[0])
-                    # Calculate confidence for corrected words
-                    similarity = SequenceMatcher(None, word.lower(), matches[0]).ratio()
-                    confidence = similarity * 100
-                    drug_confidence_scores.append(confidence)
-        except Exception as e:
-            predicted_text = f"[BERT error: {str(e)}]"
+    confident_match = bool(found) and min(drug_confidence_scores) >= BERT_SKIP_CONFIDENCE
+    return {
+        'ocr_text': words_to_text(words),
+        'words': words,
+        'found': found,
+        'scores': drug_confidence_scores,
+        'suspicious': suspicious,
+        'needs_correction': bool(suspicious) and not confident_match,
+        'formulary': current
+    }
+
+def _suspicious_texts(stage):
+    return [stage['words'][index]['text'] for index in stage['suspicious']]
+
+def _correction_sequences(stage, tokenizer):
+    """BERT inputs for the suspicious words of one image.
+
+    One sequence per line holding suspicious words, so the rest of the line
+    is context; the suspicious words' tokens are replaced by [MASK] and are
+    the only positions predicted. Lines longer than BERT_MAX_LENGTH are
+    windowed by correct_sequences. Lines go least confident first until
+    BERT_TOKEN_BUDGET tokens are used. Returns (sequences, spans), where
+    spans[i] lists (word_index, first, last) slices of sequence i's positions.
+    """
+    words = stage['words']
+    lines = {}
+    for index, word in enumerate(words):
+        lines.setdefault(word['line'], []).append(index)
+    suspicious_by_line = {}
+    for index in stage['suspicious']:
+        suspicious_by_line.setdefault(words[index]['line'], []).append(index)
+    order = sorted(suspicious_by_line, key=lambda line: min(words[i]['confidence'] for i in suspicious_by_line[line]))
+
+    sequences, spans = [], []
+    used = 0
+    for line in order:
+        suspicious = suspicious_by_line[line]
+        for members in (lines[line], suspicious):
+            text, starts = "", {}
+            for index in members:
+                text += " " if text else ""
+                starts[index] = len(text)
+                text += words[index]['text']
+            ids, offsets = tokenizer.encode_offsets(text)
+            # A line over the remaining budget falls back to its suspicious words alone
+            if used + len(ids) <= BERT_TOKEN_BUDGET:
+                break
+        else:
+            break
+
+        ids = list(ids)
+        positions, word_spans = [], []
+        for index in suspicious:
+            start, end = starts[index], starts[index] + len(words[index]['text'])
+            columns = [column for column, (first, last) in enumerate(offsets) if last > first and first >= start and last <= end]
+            word_spans.append((index, len(positions), len(positions) + len(columns)))
+            positions.extend(columns)
+        for column in positions:
+            ids[column] = tokenizer.mask_token_id
+        sequences.append((ids, positions))
+        spans.append(word_spans)
+        used += len(ids)
+    return sequences, spans
+
+def _apply_corrections(stage, spans, predicted, tokenizer):
+    """Put BERT's predictions for the suspicious words back into the text and match them.
+
+    Returns the corrected text; stage['found'] and stage['scores'] are updated in place.
+    """
+    words = [dict(word) for word in stage['words']]
+    for word_spans, ids in zip(spans, predicted):
+        for index, first, last in word_spans:
+            text = "".join(tokenizer.decode(ids[first:last]).split())
+            if text:
+                words[index]['text'] = text
+                match_drugs(text, stage['found'], stage['scores'], stage['formulary'])
+    return words_to_text(words)
+
+def _build_result(stage, predicted_text):
+    ocr_text = stage['ocr_text']
+    if not ocr_text:
+        return {
+            'ocr_text': "[No OCR found]",
+            'predicted_text': "[Skipped]",
+            'found_drugs': [],
+            'ocr_confidence': 0.0,
+            'drug_confidence': 0.0,
+            'ocr_words': []
+        }
+
+    # Mean Tesseract word confidence
+    ocr_confidence = mean_confidence(stage['words'])
+
+    found = stage['found']
+    drug_confidence_scores = stage['scores']
 
     # Calculate overall drug detection confidence
     overall_drug_confidence = 0.0
@@ -84,4 +456,166 @@ def extract_text_and_predict(image_bytes):
     else:
         overall_drug_confidence = 0.0
 
-    return ocr_text, predicted_text.strip(), list(found), ocr_confidence, overall_drug_confidence
+    return {
+        'ocr_text': ocr_text,
+        'predicted_text': predicted_text.strip(),
+        'found_drugs': list(found),
+        'ocr_confidence': ocr_confidence,
+        'drug_confidence': overall_drug_confidence,
+        'ocr_words': _public_words(stage['words'])
+    }
+
+def predict_images(images):
+    """Predict several images, sharing one batched BERT correction pass.
+
+    Returns one result dict per image, in order. An image that cannot be
+    decoded or OCRed gets {'error': ...} instead of failing the whole batch.
+    Timings of the shared correction pass are reported on every image that
+    took part in it.
+    """
+    stages = []
+    image_timings = []
+    for image_bytes in images:
+        timings = {}
+        image_timings.append(timings)
+        try:
+            stages.append(_ocr_stage(image_bytes, timings))
+        except Exception as e:
+            stages.append({'error': str(e)})
+
+    to_correct = [i for i, stage in enumerate(stages) if stage.get('needs_correction')]
+    predicted = {i: "" for i in range(len(stages))}
+    failed = False
+    if to_correct:
+        batch_timings = {}
+        try:
+            with timed(batch_timings, 'correction'):
+                tokenizer = corrector_handle.get().tokenizer
+                with timed(batch_timings, 'tokenize'):
+                    inputs = [_correction_sequences(stages[i], tokenizer) for i in to_correct]
+                outputs = correct_sequences([sequence for sequences, _ in inputs for sequence in sequences], batch_timings)
+                with timed(batch_timings, 'detokenize'):
+                    for i, (sequences, spans) in zip(to_correct, inputs):
+                        predicted[i] = _apply_corrections(stages[i], spans, outputs[:len(sequences)], tokenizer)
+                        outputs = outputs[len(sequences):]
+        except Exception as e:
+            failed = True
+            for i in to_correct:
+                predicted[i] = f"[BERT error: {str(e)}]"
+        for i in to_correct:
+            image_timings[i].update(batch_timings)
+
+    results = []
+    for i, stage in enumerate(stages):
+        if 'error' in stage:
+            results.append({'error': stage['error']})
+        else:
+            result = _build_result(stage, predicted[i])
+            result['timings'] = image_timings[i]
+            result['pipeline_version'] = pipeline_version(stage['formulary'].mtime)
+            if failed and i in to_correct:
+                result['correction_failed'] = True
+            results.append(result)
+    return results
+
+def iter_prediction(image_bytes):
+    """Run the pipeline for one upload (image, multi-page TIFF or PDF), yielding (stage, data) as each stage finishes.
+
+    Stages are 'preprocess', 'ocr', 'matches', 'correction' (only when BERT
+    runs) and finally 'result', whose data is the same dict predict_image
+    returns, including per-stage 'timings' in seconds and the
+    'pipeline_version' it was computed with.
+    """
+    timings = {}
+    stage = yield from iter_analysis(image_bytes, timings)
+    yield from iter_correction(stage, timings)
+
+def iter_analysis(image_bytes, timings):
+    """The 'preprocess', 'ocr' and 'matches' stages of iter_prediction; returns the match stage"""
+    with timed(timings, 'decode'):
+        pages = load_pages(image_bytes)
+    page_info = [{} for _ in pages]
+    with timed(timings, 'preprocess'):
+        preprocessed = _preprocess_pages(pages, page_info)
+    for info, page in zip(page_info, preprocessed):
+        info.update({'width': int(page.shape[1]), 'height': int(page.shape[0])})
+    # First page at the top level, as for single images
+    preprocess_event = dict(page_info[0])
+    preprocess_event['pages'] = len(pages)
+    if len(pages) > 1:
+        preprocess_event['page_info'] = page_info
+    yield 'preprocess', preprocess_event
+
+    words = ocr_pages(preprocessed, timings)
+    yield 'ocr', {
+        'ocr_text': words_to_text(words),
+        'ocr_confidence': mean_confidence(words),
+        'ocr_words': _public_words(words)
+    }
+
+    with timed(timings, 'match'):
+        stage = _match_stage(words)
+    yield 'matches', {
+        'found_drugs': sorted(stage['found']),
+        'suspicious_words': _suspicious_texts(stage),
+        'needs_correction': stage['needs_correction']
+    }
+    return stage
+
+def iter_correction(stage, timings):
+    """The 'correction' and 'result' stages of iter_prediction for a match stage"""
+    predicted_text = ""
+    failed = False
+    if stage['needs_correction']:
+        try:
+            with timed(timings, 'correction'):
+                tokenizer = corrector_handle.get().tokenizer
+                with timed(timings, 'tokenize'):
+                    sequences, spans = _correction_sequences(stage, tokenizer)
+                predicted = correct_masked(sequences, timings)
+                with timed(timings, 'detokenize'):
+                    predicted_text = _apply_corrections(stage, spans, predicted, tokenizer)
+        except Exception as e:
+            failed = True
+            predicted_text = f"[BERT error: {str(e)}]"
+        yield 'correction', {
+            'predicted_text': predicted_text.strip(),
+            'found_drugs': sorted(stage['found'])
+        }
+
+    result = _build_result(stage, predicted_text)
+    result['timings'] = timings
+    result['pipeline_version'] = pipeline_version(stage['formulary'].mtime)
+    if failed:
+        # Callers must not cache this result
+        result['correction_failed'] = True
+    yield 'result', result
+
+def correct_words(words, timings=None):
+    """Match and correct already-OCRed words as iter_prediction does, for evaluation tools.
+
+    Returns the predicted text, the drugs found after correction and those
+    matched before it, and whether BERT ran.
+    """
+    stage = _match_stage(words)
+    matched = sorted(stage['found'])
+    predicted_text = ""
+    if stage['needs_correction']:
+        tokenizer = corrector_handle.get().tokenizer
+        sequences, spans = _correction_sequences(stage, tokenizer)
+        predicted_text = _apply_corrections(stage, spans, correct_sequences(sequences, timings), tokenizer)
+    return {
+        'predicted_text': predicted_text.strip(),
+        'found_drugs': sorted(stage['found']),
+        'matched_drugs': matched,
+        'corrected': stage['needs_correction']
+    }
+
+def predict_image(image_bytes):
+    for _, data in iter_prediction(image_bytes):
+        result = data
+    return result
+
+def extract_text_and_predict(image_bytes):
+    result = predict_image(image_bytes)
+    return result['ocr_text'], result['predicted_text'], result['found_drugs'], result['ocr_confidence'], result['drug_confidence']
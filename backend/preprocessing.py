@@ -0,0 +1,290 @@
+# preprocessing.py
+"""Image preprocessing ahead of Tesseract.
+
+The legacy path upscales every image 2x before Otsu thresholding, which
+turns a 12 MP phone photo into a 48 MP buffer. The adaptive path measures
+the text height on a small analysis copy and rescales so characters land
+near PREPROCESS_TARGET_TEXT_HEIGHT pixels (downscaling large photos,
+upscaling small scans at most 2x as before), after optionally cropping to
+the document or text area and correcting skew.
+
+load_pages also accepts multi-page TIFFs and PDFs (rendered with the
+optional pypdfium2), and find_text_regions splits a binarized page into
+text blocks that can be OCRed in parallel.
+"""
+import io
+import os
+
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence
+
+PREPROCESS_MODE = os.getenv("PREPROCESS_MODE", "adaptive")  # adaptive or legacy
+PREPROCESS_TARGET_TEXT_HEIGHT = float(os.getenv("PREPROCESS_TARGET_TEXT_HEIGHT", "30"))  # pixels
+PREPROCESS_CROP = os.getenv("PREPROCESS_CROP", "1") == "1"
+PREPROCESS_DESKEW = os.getenv("PREPROCESS_DESKEW", "1") == "1"
+# Multi-page uploads: pages beyond MAX_PAGES are ignored
+MAX_PAGES = int(os.getenv("MAX_PAGES", "20"))
+PDF_RENDER_DPI = float(os.getenv("PDF_RENDER_DPI", "200"))
+
+# Longest side of the downscaled copy used for all measurements
+ANALYSIS_MAX_SIDE = 1000
+MIN_SCALE = 0.2
+MAX_SCALE = 2.0
+# Without a usable text-height estimate, aim for this longest side
+FALLBACK_MAX_SIDE = 2500
+MAX_DESKEW_ANGLE = 15.0
+MIN_DESKEW_ANGLE = 0.5
+# Fewer character-like components than this say nothing about the text's extent or height
+MIN_TEXT_COMPONENTS = 5
+# The text crop is skipped when more of the ink than this would fall outside it
+MAX_CROPPED_INK = 0.02
+# More regions than this is noise, OCR the page as one tile instead
+MAX_TEXT_REGIONS = 64
+
+
+def load_image(image_bytes):
+    image = Image.open(image_bytes).convert("RGB")
+    img = np.array(image)
+    if len(img.shape) == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    return img
+
+
+def _to_gray(image):
+    img = np.array(image.convert("RGB"))
+    return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+
+
+def load_pages(image_bytes):
+    """Grayscale arrays of every page of an upload: the pages of a PDF, the frames of a TIFF, or the one image"""
+    data = image_bytes.read()
+    if data[:5] == b"%PDF-":
+        try:
+            import pypdfium2
+        except ImportError:
+            raise ValueError("PDF uploads need the pypdfium2 package")
+        pdf = pypdfium2.PdfDocument(data)
+        pages = []
+        try:
+            for index in range(min(len(pdf), MAX_PAGES)):
+                bitmap = pdf[index].render(scale=PDF_RENDER_DPI / 72.0, grayscale=True)
+                pages.append(np.array(bitmap.to_pil().convert("L")))
+        finally:
+            pdf.close()
+        if not pages:
+            raise ValueError("PDF has no pages")
+        return pages
+
+    image = Image.open(io.BytesIO(data))
+    if image.format == "TIFF" and getattr(image, "n_frames", 1) > 1:
+        return [_to_gray(frame) for _, frame in zip(range(MAX_PAGES), ImageSequence.Iterator(image))]
+    return [_to_gray(image)]
+
+
+def legacy_binarize(img):
+    img = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return img
+
+
+def _analysis_copy(gray):
+    height, width = gray.shape[:2]
+    factor = min(1.0, ANALYSIS_MAX_SIDE / float(max(height, width)))
+    if factor < 1.0:
+        gray = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    return gray, factor
+
+
+def find_document_quad(small):
+    """Corners of the largest four-sided contour covering a good part of the image, or None"""
+    edges = cv2.Canny(cv2.GaussianBlur(small, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    image_area = float(small.shape[0] * small.shape[1])
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:5]:
+        area = cv2.contourArea(contour)
+        if area < 0.25 * image_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        # A quad hugging the frame is the image border, not a document edge
+        if len(approx) == 4 and area < 0.95 * image_area:
+            return approx.reshape(4, 2).astype(np.float32)
+    return None
+
+
+def _order_corners(quad):
+    sums = quad.sum(axis=1)
+    diffs = np.diff(quad, axis=1).ravel()
+    return np.array([quad[np.argmin(sums)], quad[np.argmin(diffs)], quad[np.argmax(sums)], quad[np.argmax(diffs)]], dtype=np.float32)
+
+
+def warp_document(gray, quad):
+    top_left, top_right, bottom_right, bottom_left = corners = _order_corners(quad)
+    width = int(max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left)))
+    height = int(max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right)))
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(corners, target)
+    return cv2.warpPerspective(gray, matrix, (width, height), flags=cv2.INTER_LINEAR, borderValue=255)
+
+
+def text_components(small):
+    """Stats (x, y, w, h, area) of connected components that look like characters"""
+    _, inverted = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(inverted, connectivity=8)
+    height, width = small.shape[:2]
+    stats = stats[1:]  # drop the background
+    w, h, area = stats[:, 2], stats[:, 3], stats[:, 4]
+    keep = (
+        (h >= 3) & (h <= height * 0.2) & (w <= width * 0.5) &
+        (area >= 6) & (area >= 0.1 * w * h) & (w <= 8 * h)
+    )
+    return stats[keep]
+
+
+def _ink_outside(small, x0, y0, x1, y1):
+    """Fraction of the dark pixels of small outside the box"""
+    _, inverted = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    total = cv2.countNonZero(inverted)
+    if not total:
+        return 0.0
+    return 1.0 - cv2.countNonZero(inverted[y0:y1, x0:x1]) / float(total)
+
+
+def estimate_skew(components):
+    """Skew angle in degrees of the text lines, or 0.0 when unsure.
+
+    Projects the character centres onto the vertical axis at each candidate
+    angle; text lines collapse into sharp peaks at the right one.
+    """
+    if len(components) < 10:
+        return 0.0
+    x = components[:, 0] + components[:, 2] / 2.0
+    y = components[:, 1] + components[:, 3] / 2.0
+    bin_height = max(1.0, float(np.median(components[:, 3])) / 2.0)
+    best_angle, best_score, flat_score = 0.0, -1.0, None
+    for angle in np.arange(-MAX_DESKEW_ANGLE, MAX_DESKEW_ANGLE + 0.01, 0.25):
+        radians = np.deg2rad(angle)
+        projected = y * np.cos(radians) - x * np.sin(radians)
+        counts = np.bincount(((projected - projected.min()) / bin_height).astype(np.int64))
+        score = float(np.sum(counts.astype(np.float64) ** 2))
+        if abs(angle) < 0.01:
+            flat_score = score
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    # Only rotate for a clear improvement over leaving the image as it is
+    if abs(best_angle) < MIN_DESKEW_ANGLE or (flat_score and best_score < 1.1 * flat_score):
+        return 0.0
+    return best_angle
+
+
+def rotate(gray, angle):
+    """Rotate about the centre, growing the canvas so no corner is cut off"""
+    height, width = gray.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2.0, height / 2.0), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width = int(height * sin + width * cos)
+    new_height = int(height * cos + width * sin)
+    matrix[0, 2] += new_width / 2.0 - width / 2.0
+    matrix[1, 2] += new_height / 2.0 - height / 2.0
+    return cv2.warpAffine(gray, matrix, (new_width, new_height), flags=cv2.INTER_LINEAR, borderValue=255)
+
+
+def choose_scale(text_height, shape):
+    if text_height:
+        scale = PREPROCESS_TARGET_TEXT_HEIGHT / text_height
+    else:
+        scale = FALLBACK_MAX_SIDE / float(max(shape[:2]))
+    scale = min(MAX_SCALE, max(MIN_SCALE, scale))
+    # Not worth resampling for a small change
+    return 1.0 if 0.9 <= scale <= 1.1 else scale
+
+
+def adaptive_binarize(gray, info=None):
+    """Crop, deskew and rescale gray to the target text height, then Otsu-threshold it.
+
+    info, if a dict, receives the decisions taken (crop, angle, text height, scale).
+    """
+    info = info if info is not None else {}
+
+    if PREPROCESS_CROP:
+        small, factor = _analysis_copy(gray)
+        quad = find_document_quad(small)
+        if quad is not None:
+            gray = warp_document(gray, quad / factor)
+            info['crop'] = 'document'
+
+    small, factor = _analysis_copy(gray)
+    components = text_components(small)
+
+    if PREPROCESS_CROP and 'crop' not in info and len(components) >= MIN_TEXT_COMPONENTS:
+        # Crop to the text area, with a margin so edge characters stay whole
+        x0 = components[:, 0].min()
+        y0 = components[:, 1].min()
+        x1 = (components[:, 0] + components[:, 2]).max()
+        y1 = (components[:, 1] + components[:, 3]).max()
+        margin = int(0.02 * max(small.shape[:2]))
+        x0, y0 = max(0, x0 - margin), max(0, y0 - margin)
+        x1, y1 = min(small.shape[1], x1 + margin), min(small.shape[0], y1 + margin)
+        # Glyphs too tall to count as characters (a tight crop of one line) leave only
+        # their dots as components; cropping to those would cut the text
+        if (x1 - x0) * (y1 - y0) < 0.8 * small.shape[0] * small.shape[1] and \
+           _ink_outside(small, x0, y0, x1, y1) <= MAX_CROPPED_INK:
+            gray = gray[int(y0 / factor):int(np.ceil(y1 / factor)), int(x0 / factor):int(np.ceil(x1 / factor))]
+            info['crop'] = 'text'
+
+    text_height = None
+    if len(components) >= MIN_TEXT_COMPONENTS:
+        text_height = float(np.median(components[:, 3])) / factor
+    scale = choose_scale(text_height, gray.shape)
+    info['text_height'] = round(text_height, 1) if text_height else None
+    info['scale'] = round(scale, 3)
+
+    if scale != 1.0:
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+
+    # Rotate after shrinking, so large photos are rotated at their smaller size
+    angle = estimate_skew(components) if PREPROCESS_DESKEW else 0.0
+    if angle:
+        gray = rotate(gray, angle)
+    info['angle'] = round(angle, 2)
+
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def find_text_regions(binary):
+    """Boxes (x, y, w, h) of the text blocks of a binarized page, in reading order.
+
+    Ink is smeared with a kernel about one text height tall and one and a
+    half wide, so words join into lines and lines into blocks while
+    columns and separate paragraphs stay apart.
+    """
+    height, width = binary.shape[:2]
+    whole = [(0, 0, width, height)]
+    components = text_components(binary)
+    if len(components) < 5:
+        return whole
+    text_height = float(np.median(components[:, 3]))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, int(text_height * 1.5)), max(3, int(text_height))))
+    smeared = cv2.dilate(cv2.bitwise_not(binary), kernel)
+    contours, _ = cv2.findContours(smeared, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    # The smearing already pads every box by half the kernel
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # A dilated speck is about one text height tall; a line of text is two
+        if h < 1.5 * text_height or w * h < 3 * text_height * text_height:
+            continue
+        regions.append((x, y, w, h))
+    if not regions or len(regions) > MAX_TEXT_REGIONS:
+        return whole
+    return sorted(regions, key=lambda region: (region[1], region[0]))
+
+
+def binarize(img, info=None):
+    if PREPROCESS_MODE == "legacy":
+        return legacy_binarize(img)
+    return adaptive_binarize(img, info)
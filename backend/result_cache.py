@@ -0,0 +1,198 @@
+# result_cache.py
+"""Cache of prediction results keyed on the uploaded image bytes.
+
+Keys are the SHA-256 of the image plus a pipeline version tag, so changing
+the model backend, preprocessing or formulary never serves stale results.
+An in-memory LRU with TTL sits in front of an optional persistent store
+(a directory of JSON files, or a MongoDB collection).
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+
+def make_key(image_data, version):
+    digest = hashlib.sha256(image_data).hexdigest()
+    return f"{version}:{digest}"
+
+
+class DiskStore:
+    """Directory of JSON files, one per key.
+
+    Every cleanup_interval seconds a put sweeps the directory: expired
+    files are removed, then the oldest ones until the total size is at
+    most max_bytes (0 = no size limit).
+    """
+
+    def __init__(self, directory, ttl_seconds, max_bytes=0, cleanup_interval=300.0):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.cleanup_interval = cleanup_interval
+        self._last_cleanup = 0.0
+        self._cleanup_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.ttl_seconds and time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry['value'] if entry.get('key') == key else None
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'key': key, 'value': value}, f)
+        os.replace(tmp_path, path)
+        if time.monotonic() - self._last_cleanup > self.cleanup_interval:
+            self.cleanup()
+
+    def cleanup(self):
+        """Remove expired files, then the oldest ones while over max_bytes. Returns the number removed."""
+        if not self._cleanup_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._last_cleanup = time.monotonic()
+            now = time.time()
+            files = []
+            removed = 0
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                # Leftover temporary files of interrupted writes count as expired after an hour
+                ttl = 3600 if entry.name.endswith(".tmp") else self.ttl_seconds
+                if ttl and now - stat.st_mtime > ttl:
+                    removed += self._remove(entry.path)
+                elif entry.name.endswith(".json"):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            if self.max_bytes:
+                total = sum(size for _, size, _ in files)
+                for _, size, path in sorted(files):
+                    if total <= self.max_bytes:
+                        break
+                    removed += self._remove(path)
+                    total -= size
+            return removed
+        finally:
+            self._cleanup_lock.release()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            # Another process cleaned it up first
+            return 0
+
+
+class MongoStore:
+    def __init__(self, collection, ttl_seconds):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+
+    def ensure_indexes(self):
+        # Mongo removes documents once expires_at has passed
+        self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def get(self, key):
+        entry = self.collection.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}})
+        return entry['value'] if entry else None
+
+    def put(self, key, value):
+        self.collection.replace_one(
+            {'_id': key},
+            {'_id': key, 'value': value, 'expires_at': datetime.utcnow() + timedelta(seconds=self.ttl_seconds)},
+            upsert=True
+        )
+
+
+class ResultCache:
+    def __init__(self, max_entries=1024, ttl_seconds=86400, store=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._store_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def get(self, key):
+        """Return a copy of the cached result, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+
+        if self.store is not None:
+            try:
+                value = self.store.get(key)
+            except Exception:
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self._store_hits += 1
+                return copy.deepcopy(value)
+
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key, value):
+        value = copy.deepcopy(value)
+        self._remember(key, value)
+        if self.store is not None:
+            try:
+                self.store.put(key, value)
+            except Exception:
+                # A failing persistent store must not fail the prediction
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._store_hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'store': type(self.store).__name__ if self.store is not None else None,
+                'hits': self._hits,
+                'store_hits': self._store_hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'hit_rate': round((self._hits + self._store_hits) / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,160 @@
+# runtimes.py
+"""Tokenizer and model runtimes used by the BERT corrector.
+
+The tokenizer wraps the `tokenizers` library directly so graph runtimes
+(ONNX, TorchScript) can serve without importing `transformers`. Every
+runtime takes a dict of int64 NumPy arrays (input_ids, attention_mask,
+token_type_ids) and returns argmax token ids as a NumPy array, either for
+every position (predict_ids) or only at given (row, column) positions
+(predict_positions).
+
+With a sub-vocabulary output head (see output_vocab.py) logits cover only
+the kept ids, and argmax positions are mapped back to tokenizer ids.
+"""
+import json
+import os
+import numpy as np
+
+
+def output_ids_path(graph_path):
+    """Sidecar listing the output ids of a graph exported with a sub-vocabulary head"""
+    return graph_path + ".vocab.json"
+
+
+def _load_output_ids(graph_path):
+    path = output_ids_path(graph_path)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return np.array(json.load(f), dtype=np.int64)
+
+
+class CorrectorTokenizer:
+    def __init__(self, tokenizer_dir):
+        from tokenizers import Tokenizer
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(tokenizer_dir, "tokenizer.json"))
+        self.pad_token_id = self._tokenizer.token_to_id("[PAD]")
+        self.cls_token_id = self._tokenizer.token_to_id("[CLS]")
+        self.sep_token_id = self._tokenizer.token_to_id("[SEP]")
+        self.mask_token_id = self._tokenizer.token_to_id("[MASK]")
+        self.vocab_size = self._tokenizer.get_vocab_size()
+
+    def encode_batch(self, texts, max_length=None):
+        """Token ids per text, including [CLS]/[SEP], truncated to max_length like BertTokenizerFast"""
+        encoded = [encoding.ids for encoding in self._tokenizer.encode_batch(list(texts))]
+        if max_length is not None:
+            encoded = [ids if len(ids) <= max_length else ids[:max_length - 1] + [self.sep_token_id] for ids in encoded]
+        return encoded
+
+    def encode_offsets(self, text):
+        """Token ids of text, with [CLS]/[SEP], and the (start, end) character span of each token"""
+        encoding = self._tokenizer.encode(text)
+        return encoding.ids, encoding.offsets
+
+    def pad(self, sequences):
+        """Right-pad id lists into the arrays every runtime expects"""
+        width = max(len(ids) for ids in sequences)
+        input_ids = np.full((len(sequences), width), self.pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(sequences), width), dtype=np.int64)
+        for row, ids in enumerate(sequences):
+            input_ids[row, :len(ids)] = ids
+            attention_mask[row, :len(ids)] = 1
+        return {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
+            'token_type_ids': np.zeros_like(input_ids)
+        }
+
+    def decode(self, ids):
+        return self._tokenizer.decode([int(i) for i in ids], skip_special_tokens=True)
+
+
+class TorchRuntime:
+    """Eager PyTorch BertForMaskedLM (FP32 or dynamically quantized).
+
+    output_head, if given, is (ids, weight, bias): the decoder rows of the
+    kept ids, used in place of the full vocabulary projection.
+    """
+
+    def __init__(self, model, output_head=None):
+        self.model = model
+        self.output_ids = None
+        if output_head is not None:
+            self.output_ids, self._weight, self._bias = output_head
+
+    def _argmax(self, hidden):
+        import torch
+
+        if self.output_ids is None:
+            return torch.argmax(self.model.cls(hidden), dim=-1).numpy()
+        states = self.model.cls.predictions.transform(hidden)
+        logits = torch.nn.functional.linear(states, self._weight, self._bias)
+        return self.output_ids[torch.argmax(logits, dim=-1).numpy()]
+
+    def predict_ids(self, batch):
+        import torch
+
+        inputs = {name: torch.from_numpy(array) for name, array in batch.items()}
+        with torch.no_grad():
+            if self.output_ids is None:
+                logits = self.model(**inputs).logits
+                return torch.argmax(logits, dim=-1).numpy()
+            return self._argmax(self.model.bert(**inputs).last_hidden_state)
+
+    def predict_positions(self, batch, rows, cols):
+        """Run the encoder on the batch but the MLM head only on the selected positions"""
+        import torch
+
+        inputs = {name: torch.from_numpy(array) for name, array in batch.items()}
+        with torch.no_grad():
+            hidden = self.model.bert(**inputs).last_hidden_state
+            return self._argmax(hidden[torch.from_numpy(rows), torch.from_numpy(cols)])
+
+
+class TorchScriptRuntime:
+    def __init__(self, path):
+        import torch
+
+        self.module = torch.jit.load(path, map_location="cpu")
+        self.module.eval()
+        self.output_ids = _load_output_ids(path)
+
+    def predict_ids(self, batch):
+        import torch
+
+        with torch.no_grad():
+            logits = self.module(
+                torch.from_numpy(batch['input_ids']),
+                torch.from_numpy(batch['attention_mask']),
+                torch.from_numpy(batch['token_type_ids'])
+            )
+            predicted = torch.argmax(logits, dim=-1).numpy()
+        return predicted if self.output_ids is None else self.output_ids[predicted]
+
+    def predict_positions(self, batch, rows, cols):
+        # The exported graph computes logits at every position
+        return self.predict_ids(batch)[rows, cols]
+
+
+class OnnxRuntime:
+    def __init__(self, path, threads=0, interop_threads=0):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # 0 leaves ONNX Runtime's default of one thread per core
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = interop_threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.output_ids = _load_output_ids(path)
+
+    def predict_ids(self, batch):
+        logits = self.session.run(["logits"], {name: batch[name] for name in self.input_names})[0]
+        predicted = np.argmax(logits, axis=-1)
+        return predicted if self.output_ids is None else self.output_ids[predicted]
+
+    def predict_positions(self, batch, rows, cols):
+        # The exported graph computes logits at every position
+        return self.predict_ids(batch)[rows, cols]
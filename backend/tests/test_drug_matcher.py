@@ -0,0 +1,65 @@
+import random
+import string
+from difflib import get_close_matches
+
+import pytest
+
+from drug_matcher import DrugMatcher
+
+SEED = 1234
+LOOKUPS = 1000
+
+
+def _random_names(rng, count):
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 14))))
+    return list(names)
+
+
+def _misspell(rng, name):
+    chars = list(name)
+    for _ in range(rng.randint(0, 3)):
+        edit = rng.choice(("delete", "insert", "replace", "swap"))
+        position = rng.randrange(len(chars)) if chars else 0
+        if edit == "delete" and len(chars) > 1:
+            del chars[position]
+        elif edit == "insert":
+            chars.insert(position, rng.choice(string.ascii_lowercase))
+        elif edit == "replace" and chars:
+            chars[position] = rng.choice(string.ascii_lowercase)
+        elif edit == "swap" and position + 1 < len(chars):
+            chars[position], chars[position + 1] = chars[position + 1], chars[position]
+    return "".join(chars)
+
+
+@pytest.mark.parametrize("cutoff", [0.6, 0.75, 0.9])
+def test_best_match_agrees_with_difflib(cutoff):
+    rng = random.Random(SEED)
+    matcher = DrugMatcher(_random_names(rng, 1000), cutoff=cutoff)
+    for _ in range(LOOKUPS):
+        if rng.random() < 0.8:
+            word = _misspell(rng, rng.choice(matcher.names))
+        else:
+            word = _random_names(rng, 1)[0]
+        expected = get_close_matches(word, matcher.names, n=1, cutoff=cutoff)
+        match = matcher.best_match(word)
+        assert (match[0] if match else None) == (expected[0] if expected else None), word
+
+
+def test_best_match_of_empty_word():
+    assert DrugMatcher(["paracetamol"]).best_match("") is None
+
+
+def test_candidates_stay_a_small_fraction_of_a_large_formulary():
+    from benchmarks.bench_matcher import make_queries
+    from benchmarks.synthetic import generate_drug_names
+
+    matcher = DrugMatcher(generate_drug_names(20000, seed=SEED))
+    queries = make_queries(matcher.names, 200, seed=SEED)
+    mean_candidates = sum(matcher.candidate_count(query) for query in queries) / len(queries)
+    assert mean_candidates < 0.01 * len(matcher.names)
+    for query in queries[:50]:
+        expected = get_close_matches(query, matcher.names, n=1, cutoff=matcher.cutoff)
+        match = matcher.best_match(query)
+        assert (match[0] if match else None) == (expected[0] if expected else None), query
@@ -0,0 +1,62 @@
+import pytest
+
+import predictor
+from drug_dictionary import DrugDictionary, FormularyStore
+
+FORMULARY = """\
+amox\tAmoxicillin
+amox\tAmoxicillin 500 mg
+amox\tAmoxil  250 mg
+metf\tMetformin
+metf\tMetformin 850 mg tablet
+"""
+
+
+@pytest.fixture
+def formulary_path(tmp_path):
+    path = tmp_path / "formulary.tsv"
+    path.write_text(FORMULARY)
+    return str(path)
+
+
+def _words(*lines):
+    return [{'text': text, 'confidence': 50.0, 'box': [0, 0, 1, 1], 'page': 0, 'block': 0, 'par': 0, 'line': line}
+            for line, texts in enumerate(lines) for text in texts.split()]
+
+
+def _matches(current, text):
+    words = text.split()
+    return [(" ".join(words[start:end]), match[0], round(match[1]))
+            for start, end, match in predictor._match_words(current, words)]
+
+
+def test_max_words_survives_index(formulary_path, tmp_path):
+    dictionary = DrugDictionary.from_source(formulary_path)
+    assert dictionary.max_words == 4
+    assert dictionary.resolve("amoxil 250 mg") == ("amox", "amoxicillin")
+
+    index_path = str(tmp_path / "formulary.fidx")
+    dictionary.save_index(index_path)
+    assert DrugDictionary.from_index(index_path).max_words == 4
+
+
+def test_multi_word_names_match(formulary_path):
+    current = FormularyStore(formulary_path).current()
+
+    assert _matches(current, "Amoxicillin 500 mg tid") == [("Amoxicillin 500 mg", "amoxicillin", 100)]
+    assert _matches(current, "Metformin 850 mg tablet daily") == [("Metformin 850 mg tablet", "metformin", 100)]
+    # OCR misspellings still match the whole phrase
+    assert _matches(current, "Amoxicilin 500 mg") == [("Amoxicilin 500 mg", "amoxicillin", 97)]
+    # A different strength is not that entry, only the name matches
+    assert _matches(current, "Amoxicillin 750 mg") == [("Amoxicillin", "amoxicillin", 100)]
+    assert _matches(current, "Amoxicillin bid") == [("Amoxicillin", "amoxicillin", 100)]
+
+
+def test_match_stage_matches_within_lines(formulary_path, monkeypatch):
+    monkeypatch.setattr(predictor, "formulary", FormularyStore(formulary_path))
+
+    stage = predictor._match_stage(_words("Amoxicillin 500 mg", "Metformin 850", "mg tablet qxz"))
+    assert stage['found'] == {"amoxicillin", "metformin"}
+    assert stage['scores'] == [100.0, 100.0]
+    # A name is not matched across lines, and matched words are never suspicious
+    assert [stage['words'][index]['text'] for index in stage['suspicious']] == ["tablet", "qxz"]
@@ -0,0 +1,38 @@
+import cv2
+import numpy as np
+import pytest
+
+from preprocessing import adaptive_binarize
+
+
+def _one_line(text, width):
+    """Tight crop of one printed line, glyphs taller than 20% of the image"""
+    image = np.full((34, width), 255, dtype=np.uint8)
+    cv2.putText(image, text, (3, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2, cv2.LINE_AA)
+    return image
+
+
+@pytest.mark.parametrize("text, width", [
+    ("Amoxicillin 250 mg tid", 309),
+    # Enough i-dots to pass for a text block on their own
+    ("Ciprofloxacin digoxin lisinopril tid", 480)
+])
+def test_one_line_image_is_not_cropped_to_its_dots(text, width):
+    image = _one_line(text, width)
+    info = {}
+    binary = adaptive_binarize(image, info)
+    assert info.get('crop') != 'text'
+    # Every glyph survives: as much ink, relative to the area, as the input
+    scale = info['scale']
+    assert binary.shape == (round(image.shape[0] * scale), round(image.shape[1] * scale))
+    ink = np.count_nonzero(image < 128) * scale * scale
+    assert np.count_nonzero(binary == 0) >= 0.8 * ink
+
+
+def test_text_on_a_blank_page_is_cropped():
+    page = np.full((1200, 900), 255, dtype=np.uint8)
+    for line in range(8):
+        cv2.putText(page, "Paracetamol 500 mg twice daily", (200, 400 + line * 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, 0, 2)
+    info = {}
+    adaptive_binarize(page, info)
+    assert info['crop'] == 'text'
@@ -0,0 +1,335 @@
+# worker_pool.py
+"""Process-pool execution tier for OCR + BERT inference.
+
+With INFERENCE_WORKERS > 0 predictions run in separate worker processes,
+each holding its own copy of the corrector and limited to a share of the
+machine's cores (see cpu_topology.py), so a slow image never blocks a Flask thread that serves
+auth or dashboard requests. With INFERENCE_WORKERS=0 (the default)
+predictions run in the web process as before.
+
+With INFERENCE_START_METHOD=fork (Linux) the corrector is loaded once in
+the web process and the workers are forked from it. The weights are only
+ever read, so their pages stay shared copy-on-write and each additional
+worker costs little more than its activations and OCR buffers.
+
+Forking is only safe while the web process runs no other threads (torch,
+OpenMP, OCR, the MongoDB client's monitors), so start_background forks
+every worker at once from the main thread, before the app creates its
+MongoDB client, after loading the corrector single-threaded; only then
+does the web process get its share of the cores back for any inference it
+runs itself. The
+workers recreate predictor's threads; they must not use the parent's
+MongoDB client or other thread-backed state. A pool restarted after a
+worker died is started with spawn, because by then the web process runs
+inference threads of its own.
+"""
+import gc
+import io
+import os
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from cpu_topology import (
+    THREAD_ENV_VARS, WORKER_CPU_AFFINITY, WORKER_INTEROP_THREADS, WORKER_TORCH_THREADS, applied, available_cpus,
+    configure, replica_count, replica_cpus
+)
+
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+INFERENCE_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "60"))  # seconds
+# spawn: every worker loads its own corrector; fork: workers share the parent's
+INFERENCE_START_METHOD = os.getenv("INFERENCE_START_METHOD", "spawn")
+
+
+def _preload_shared():
+    """Load the corrector in this process, for forked workers to inherit.
+
+    Loading runs single-threaded: a parent that never started OpenMP
+    threads can be forked safely. Returns the thread variables this set in
+    the environment, for _restore_parent_threads.
+    """
+    from model_loader import corrector_handle
+
+    preload_env = [name for name in THREAD_ENV_VARS if name not in os.environ]
+    configure(threads=1, interop_threads=1)
+    corrector_handle.get()
+    # Objects in the permanent generation are never touched by the garbage
+    # collector, which would otherwise copy their pages into every worker
+    gc.freeze()
+    return preload_env
+
+
+def _restore_parent_threads(preload_env):
+    """Give the web process its share of the cores back once every worker is forked"""
+    for name in preload_env:
+        os.environ.pop(name, None)
+    applied.clear()
+    configure(use_torch=True)
+
+
+def _init_worker(counter, workers, threads, interop_threads, pin, forked):
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+
+    # One request at a time reaches a worker, so there is nothing to micro-batch
+    os.environ["BERT_BATCH_WINDOW_MS"] = "0"
+    # OCR tiles share the worker's cores with torch
+    os.environ.setdefault("OCR_THREADS", str(threads))
+    if forked:
+        # The parent's single-threaded loading settings
+        applied.clear()
+    configure(threads, interop_threads, replica_cpus(index, workers) if pin else None)
+
+    import numpy as np
+    import predictor
+    from model_loader import corrector_handle
+    predictor.correction_batcher = None
+    if forked:
+        predictor.restart_threads()
+    corrector_handle.get()
+    # Load the OCR language data now rather than on the first request
+    predictor.ocr_image(np.full((32, 32), 255, dtype=np.uint8))
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _predict(image_data):
+    from predictor import predict_image
+    return predict_image(io.BytesIO(image_data))
+
+
+def _predict_batch(image_data):
+    from predictor import predict_images
+    return predict_images([io.BytesIO(data) for data in image_data])
+
+
+def _analyze(image_data):
+    """OCR and match stages of predictor.iter_prediction; returns (events, stage, timings)"""
+    from predictor import iter_analysis
+    timings = {}
+    analysis = iter_analysis(io.BytesIO(image_data), timings)
+    events = []
+    try:
+        while True:
+            events.append(next(analysis))
+    except StopIteration as done:
+        stage = done.value
+    # The formulary snapshot does not pickle; _correct looks it up again by mtime
+    stage['formulary'] = stage['formulary'].mtime
+    return events, stage, timings
+
+
+def _correct(args):
+    """Correction and result stages for a stage returned by _analyze"""
+    import predictor
+    stage, timings = args
+    mtime = stage['formulary']
+    stage['formulary'] = predictor.formulary.current()
+    events = list(predictor.iter_correction(stage, timings))
+    if stage['formulary'].mtime != mtime:
+        # Matched with a formulary this worker no longer has; tag it with
+        # the one matching used, so it is cached under the right version
+        events[-1][1]['pipeline_version'] = predictor.pipeline_version(mtime)
+    return events
+
+
+class InferencePool:
+    def __init__(self, workers, threads_per_worker=0, interop_threads=1, pin=False, start_method="spawn", timeout=60.0):
+        self.workers = workers
+        # Pools of other web processes share the cores too (see cpu_topology.py)
+        self.threads_per_worker = threads_per_worker or max(1, len(available_cpus()) // replica_count(workers))
+        self.interop_threads = interop_threads
+        self.pin = pin
+        self.start_method = start_method
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executor = None
+        self._state = "not_started"
+        self._error = None
+        self._started_at = None
+        self._ready_time = None
+        self._worker_pids = []
+        self._forked = False
+        self._current_start_method = None
+
+    def _create_executor(self):
+        # Fork only the first pool, see the module docstring
+        start_method = self.start_method
+        if start_method == "fork" and (self._forked or threading.current_thread() is not threading.main_thread()):
+            start_method = "spawn"
+        forked = start_method == "fork"
+        preload_env = _preload_shared() if forked else None
+        context = multiprocessing.get_context(start_method)
+        counter = context.Value("i", 0)
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(counter, self.workers, self.threads_per_worker, self.interop_threads, self.pin, forked)
+        )
+        if forked:
+            # Every submit before a worker is idle forks one, so all are forked before the parent starts threads
+            for _ in range(self.workers):
+                executor.submit(_warm_up)
+            self._forked = True
+            _restore_parent_threads(preload_env)
+        self._current_start_method = start_method
+        return executor
+
+    def _executor_or_start(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def warm(self):
+        # Every warm-up task starts one worker, which loads its model in the initializer
+        if self._state != "starting":
+            self._state = "starting"
+            self._started_at = time.time()
+        try:
+            executor = self._executor_or_start()
+            futures = [executor.submit(_warm_up) for _ in range(self.workers)]
+            self._worker_pids = sorted(set(future.result() for future in futures))
+        except Exception as e:
+            self._state = "failed"
+            self._error = str(e)
+            return
+        self._ready_time = time.time() - self._started_at
+        self._state = "ready"
+
+    def start_background(self):
+        """Start the workers; their model loads are waited for in a background thread.
+
+        A fork pool is forked here, in the calling thread, so the first call
+        must come from the main thread before it starts any other thread.
+        """
+        if self.start_method == "fork" and not self._forked:
+            self._state = "starting"
+            self._started_at = time.time()
+            try:
+                self._executor_or_start()
+            except Exception as e:
+                self._state = "failed"
+                self._error = str(e)
+                return
+        threading.Thread(target=self.warm, name="inference-pool-warmup", daemon=True).start()
+
+    def run(self, fn, arg, timeout=None):
+        """Call fn(arg) in a worker; fn must be importable by the workers"""
+        executor = self._executor_or_start()
+        try:
+            return executor.submit(fn, arg).result(timeout=timeout or self.timeout)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); start a fresh pool for the next request
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+                    self._state = "restarting"
+            self.start_background()
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._state = "stopped"
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def predict(self, image_data, timeout=None):
+        return self.run(_predict, image_data, timeout)
+
+    def predict_batch(self, image_data, timeout=None):
+        return self.run(_predict_batch, image_data, timeout)
+
+    def is_ready(self):
+        return self._state == "ready"
+
+    def memory(self):
+        """Memory of this process and every worker; pss_mb counts shared pages once across processes"""
+        executor = self._executor
+        # Warm-up only reports the workers that picked up a warm-up task
+        pids = sorted(executor._processes) if executor is not None and executor._processes else self._worker_pids
+        return [_memory_mb(pid) for pid in [os.getpid()] + pids]
+
+    def status(self):
+        return {
+            'state': self._state,
+            'ready': self._state == "ready",
+            'workers': self.workers,
+            'threads_per_worker': self.threads_per_worker,
+            'interop_threads': self.interop_threads,
+            'cpu_affinity': self.pin,
+            'start_method': self.start_method,
+            'current_start_method': self._current_start_method,
+            'worker_pids': self._worker_pids,
+            'started_at': self._started_at,
+            'ready_time_seconds': self._ready_time,
+            'error': self._error
+        }
+
+
+def _memory_mb(pid):
+    """RSS, proportional (PSS) and private memory of a process, from /proc on Linux"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    values[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return {'pid': pid}
+    return {
+        'pid': pid,
+        'rss_mb': round(values.get("Rss", 0) / 1024.0, 1),
+        'pss_mb': round(values.get("Pss", 0) / 1024.0, 1),
+        'private_mb': round((values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)) / 1024.0, 1)
+    }
+
+
+inference_pool = None
+if INFERENCE_WORKERS > 0:
+    inference_pool = InferencePool(
+        INFERENCE_WORKERS,
+        threads_per_worker=WORKER_TORCH_THREADS,
+        interop_threads=WORKER_INTEROP_THREADS,
+        pin=WORKER_CPU_AFFINITY,
+        start_method=INFERENCE_START_METHOD,
+        timeout=INFERENCE_TIMEOUT
+    )
+
+
+def run_predict(image_data, timeout=None):
+    """Predict one image (raw bytes) in the worker pool, or inline when the pool is off"""
+    if inference_pool is None:
+        from predictor import predict_image
+        return predict_image(io.BytesIO(image_data))
+    return inference_pool.predict(image_data, timeout)
+
+
+def run_predict_batch(image_data, timeout=None):
+    if inference_pool is None:
+        from predictor import predict_images
+        return predict_images([io.BytesIO(data) for data in image_data])
+    return inference_pool.predict_batch(image_data, timeout)
+
+
+def run_prediction_stages(image_data, timeout=None):
+    """(stage, data) events of predictor.iter_prediction for one image (raw bytes).
+
+    In the worker pool OCR and matching run as one task and correction as
+    another, so the match events are yielded before correction starts.
+    """
+    if inference_pool is None:
+        from predictor import iter_prediction
+        yield from iter_prediction(io.BytesIO(image_data))
+        return
+    events, stage, timings = inference_pool.run(_analyze, image_data, timeout)
+    yield from events
+    yield from inference_pool.run(_correct, (stage, timings), timeout)
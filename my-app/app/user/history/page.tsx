@@ -1,6 +1,7 @@
 "use client"
 
-import { useEffect, useState } from "react"
+import { useCallback, useEffect, useState } from "react"
+import { Button } from "@/components/ui/button"
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
 import { useToast } from "@/components/ui/use-toast"
 import { Loader2 } from "lucide-react"
@@ -16,41 +17,53 @@ export default function HistoryPage() {
   const { toast } = useToast()
   const [history, setHistory] = useState<HistoryEntry[]>([])
   const [isLoading, setIsLoading] = useState(true)
+  const [isLoadingMore, setIsLoadingMore] = useState(false)
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
 
-  useEffect(() => {
-    const fetchHistory = async () => {
-      try {
-        const token = localStorage.getItem('token')
-        if (!token) {
-          throw new Error('No authentication token found')
-        }
-
-        const response = await fetch('http://localhost:5000/api/history', {
-          headers: {
-            'Authorization': `Bearer ${token}`
-          }
-        })
+  // The API returns one page at a time, newest first
+  const fetchHistory = useCallback(async (cursor: string | null) => {
+    try {
+      const token = localStorage.getItem('token')
+      if (!token) {
+        throw new Error('No authentication token found')
+      }
 
-        if (!response.ok) {
-          throw new Error('Failed to fetch history')
+      const params = new URLSearchParams({ fields: 'ocr_text,found_drugs' })
+      if (cursor) {
+        params.set('cursor', cursor)
+      }
+      const response = await fetch(`http://localhost:5000/api/history?${params}`, {
+        headers: {
+          'Authorization': `Bearer ${token}`
         }
+      })
 
-        const data = await response.json()
-        setHistory(data.history)
-      } catch (error) {
-        toast({
-          title: "Error",
-          description: error instanceof Error ? error.message : "Failed to fetch history",
-          variant: "destructive",
-        })
-      } finally {
-        setIsLoading(false)
+      if (!response.ok) {
+        throw new Error('Failed to fetch history')
       }
-    }
 
-    fetchHistory()
+      const data = await response.json()
+      setHistory((previous) => cursor ? [...previous, ...data.history] : data.history)
+      setNextCursor(data.next_cursor)
+    } catch (error) {
+      toast({
+        title: "Error",
+        description: error instanceof Error ? error.message : "Failed to fetch history",
+        variant: "destructive",
+      })
+    }
   }, [toast])
 
+  useEffect(() => {
+    fetchHistory(null).finally(() => setIsLoading(false))
+  }, [fetchHistory])
+
+  const loadMore = async () => {
+    setIsLoadingMore(true)
+    await fetchHistory(nextCursor)
+    setIsLoadingMore(false)
+  }
+
   const formatDate = (dateString: string) => {
     return new Date(dateString).toLocaleString()
   }
@@ -96,6 +109,14 @@ export default function HistoryPage() {
               </CardContent>
             </Card>
           ))}
+          {nextCursor && (
+            <div className="flex justify-center">
+              <Button variant="outline" onClick={loadMore} disabled={isLoadingMore}>
+                {isLoadingMore && <Loader2 className="mr-2 h-4 w-4 animate-spin" />}
+                Load more
+              </Button>
+            </div>
+          )}
         </div>
       )}
     </div>
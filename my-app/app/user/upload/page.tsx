@@ -27,17 +27,17 @@ export default function UploadPage() {
     const file = acceptedFiles[0]
     if (file) {
       // Check file type
-      if (!['image/jpeg', 'image/png', 'application/pdf'].includes(file.type)) {
+      if (!['image/jpeg', 'image/png', 'image/tiff', 'application/pdf'].includes(file.type)) {
         toast({
           title: "Invalid file type",
-          description: "Please upload a JPG, PNG, or PDF file.",
+          description: "Please upload a JPG, PNG, TIFF, or PDF file.",
           variant: "destructive",
         })
         return
       }
       setSelectedFile(file)
       // Create preview URL for image files
-      if (file.type.startsWith('image/')) {
+      if (file.type.startsWith('image/') && file.type !== 'image/tiff') {
         const url = URL.createObjectURL(file)
         setPreviewUrl(url)
       } else {
@@ -51,6 +51,7 @@ export default function UploadPage() {
     accept: {
       'image/jpeg': ['.jpg', '.jpeg'],
       'image/png': ['.png'],
+      'image/tiff': ['.tif', '.tiff'],
       'application/pdf': ['.pdf'],
     },
     maxFiles: 1,
@@ -110,7 +111,7 @@ export default function UploadPage() {
         <CardHeader>
           <CardTitle>Upload New Prescription</CardTitle>
           <CardDescription>
-            Please upload a clear image of a handwritten prescription. Accepted formats: JPG, PNG, PDF.
+            Please upload a clear image of a handwritten prescription. Accepted formats: JPG, PNG, TIFF, PDF.
           </CardDescription>
         </CardHeader>
         <CardContent>